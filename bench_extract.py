@@ -0,0 +1,99 @@
+import os
+import glob
+import json
+import time
+import argparse
+import concurrent.futures
+from bs4 import BeautifulSoup
+from webscraper import (
+    extract_page, extract_links, MIN_TEXT_LENGTH, MIN_WORD_COUNT, MAX_BOILERPLATE_RATIO, USELESS_BODY_KEYWORDS,
+)
+
+FIXTURE_DIR = "fixtures/html"
+
+
+def legacy_is_useful(text: str) -> bool:
+    text_lower = text.lower()
+    if any(kw in text_lower for kw in USELESS_BODY_KEYWORDS):
+        return False
+    if len(text) < MIN_TEXT_LENGTH:
+        return False
+    if len(text.split()) < MIN_WORD_COUNT:
+        return False
+    lines = [l for l in text.splitlines() if l.strip()]
+    if lines:
+        boilerplate_lines = sum(1 for l in lines if len(l.split()) <= 3)
+        if boilerplate_lines / len(lines) > MAX_BOILERPLATE_RATIO:
+            return False
+    return True
+
+
+def legacy_extract(html: str, url: str, follow_links: bool) -> tuple:
+    # The pre-change path: one soup for links, a second for the document,
+    # then several passes over the text.
+    links = extract_links(BeautifulSoup(html, "lxml"), url) if follow_links else []
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "nav", "footer", "header", "aside"]):
+        tag.decompose()
+    title = soup.title.string.strip() if soup.title and soup.title.string else ""
+    main_content = soup.find("main") or soup.find("article") or soup.find("body") or soup
+    text = main_content.get_text(separator="\n", strip=True)
+    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+    doc = {"id": title, "url": url, "text": text}
+    return (doc if legacy_is_useful(text) else None), links
+
+
+def load_fixtures(fixture_dir: str) -> list:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append((f"https://fixture.local/{os.path.basename(path)}", f.read()))
+    return pages
+
+
+def run(pages: list, repeat: int, workers: int) -> dict:
+    for url, html in pages:
+        doc, links = legacy_extract(html, url, True)
+        new_doc, new_links, _, _, _ = extract_page(html, url, True)
+        if doc != new_doc or sorted(links) != sorted(new_links):
+            raise AssertionError(f"single-parse extraction differs from legacy for {url}")
+
+    jobs = pages * repeat
+    total_bytes = sum(len(html) for _, html in jobs)
+    report = {"pages": len(jobs), "mb": total_bytes / 1e6}
+
+    start = time.perf_counter()
+    for url, html in jobs:
+        legacy_extract(html, url, True)
+    report["legacy_pages_per_sec"] = len(jobs) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for url, html in jobs:
+        extract_page(html, url, True)
+    report["single_parse_pages_per_sec"] = len(jobs) / (time.perf_counter() - start)
+
+    urls = [url for url, _ in jobs]
+    htmls = [html for _, html in jobs]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(extract_page, htmls[:workers], urls[:workers], [True] * workers))
+        start = time.perf_counter()
+        list(pool.map(extract_page, htmls, urls, [True] * len(jobs), chunksize=4))
+        report[f"process_pool_{workers}_pages_per_sec"] = len(jobs) / (time.perf_counter() - start)
+
+    report["single_parse_speedup"] = report["single_parse_pages_per_sec"] / report["legacy_pages_per_sec"]
+    report["process_pool_speedup"] = report[f"process_pool_{workers}_pages_per_sec"] / report["legacy_pages_per_sec"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction throughput on saved HTML fixtures.")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(json.dumps(run(load_fixtures(args.fixtures), args.repeat, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
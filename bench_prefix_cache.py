@@ -0,0 +1,74 @@
+import time
+import json
+import argparse
+import statistics
+import torch
+from generate import _retrieve_prompt, _prepare_batch_tokenizer, _generate_batch, _prefix_cache
+from process import CustomHybridRetriever
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+INPUT_FILE = "leaderboard_queries.json"
+MODEL_ID = "meta-llama/Llama-3.2-3B-Instruct"
+
+
+def _sync(model):
+    if model.device.type == "cuda":
+        torch.cuda.synchronize(model.device)
+
+
+def time_to_first_token(prompts, tokenizer, model, reuse_prefix):
+    timings = []
+    for prompt in prompts:
+        _sync(model)
+        start = time.perf_counter()
+        _generate_batch([prompt], tokenizer, model, reuse_prefix=reuse_prefix, max_new_tokens=1)
+        _sync(model)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(prompts, tokenizer, model):
+    _prepare_batch_tokenizer(tokenizer)
+    # Build the prefix cache and warm up kernels outside the timed region.
+    _prefix_cache(tokenizer, model)
+    _generate_batch(prompts[:1], tokenizer, model, reuse_prefix=False, max_new_tokens=1)
+    _generate_batch(prompts[:1], tokenizer, model, reuse_prefix=True, max_new_tokens=1)
+
+    report = {}
+    for name, reuse in [("no_reuse", False), ("prefix_reuse", True)]:
+        timings = time_to_first_token(prompts, tokenizer, model, reuse)
+        report[name] = {
+            "mean_ttft_ms": 1000 * statistics.mean(timings),
+            "p50_ttft_ms": 1000 * statistics.median(timings),
+        }
+    report["speedup"] = report["no_reuse"]["mean_ttft_ms"] / report["prefix_reuse"]["mean_ttft_ms"]
+    report["prefix_tokens"] = len(_prefix_cache(tokenizer, model)[0])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-first-token with and without prefix KV-cache reuse.")
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--index", default="rag_index")
+    parser.add_argument("--limit", type=int, default=50, help="number of leaderboard queries to time")
+    args = parser.parse_args()
+
+    retriever = CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2')
+    retriever.load_index(args.index)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model,
+        device_map="auto",
+        torch_dtype=torch.bfloat16,
+        trust_remote_code=True
+    )
+
+    with open(INPUT_FILE, "r") as f:
+        queries = json.load(f)[:args.limit]
+    prompts = [_retrieve_prompt(item["question"], retriever, tokenizer) for item in queries]
+
+    print(json.dumps(run(prompts, tokenizer, model), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import webscraper
+
+ASSET_BYTES = 64 * 1024
+ASSET_DELAY = 0.02
+IMAGES_PER_PAGE = 12
+ASSET_TYPES = {
+    ".png": "image/png",
+    ".woff2": "font/woff2",
+    ".css": "text/css",
+    ".mp4": "video/mp4",
+    ".js": "application/javascript",
+}
+
+
+def fixture_page(n: str) -> bytes:
+    images = "\n".join(f'<img src="/asset/{n}-{i}.png">' for i in range(IMAGES_PER_PAGE))
+    paragraphs = "\n".join(
+        f"<p>Fixture page {n}, paragraph {i}: Pittsburgh sits at the confluence of the Allegheny "
+        f"and Monongahela rivers, which form the Ohio River.</p>"
+        for i in range(20)
+    )
+    return f"""<html><head><title>Fixture {n}</title>
+<link rel="stylesheet" href="/asset/{n}.css">
+<style>@font-face {{ font-family: f; src: url(/asset/{n}.woff2); }} body {{ font-family: f; }}</style>
+<script src="/asset/{n}.js"></script>
+</head><body><main><h1>Fixture {n}</h1>{paragraphs}{images}
+<video src="/asset/{n}.mp4" autoplay></video></main></body></html>""".encode("utf-8")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # Local stand-in site: /page/<n> is an HTML page that pulls in images,
+    # a font, a stylesheet, a script and a video from /asset/, each of which
+    # is served after a short delay like a remote CDN.
+    def do_GET(self):
+        if self.path.startswith("/page/"):
+            body, content_type = fixture_page(self.path.rsplit("/", 1)[-1]), "text/html; charset=utf-8"
+        elif self.path.startswith("/asset/"):
+            time.sleep(ASSET_DELAY)
+            ext = os.path.splitext(self.path)[1]
+            body = b"// fixture\n" if ext == ".js" else b"\0" * ASSET_BYTES
+            content_type = ASSET_TYPES.get(ext, "application/octet-stream")
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server(handler=FixtureHandler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def browser_rss_mb() -> float:
+    # Resident memory of every process descended from this one (Chromium and
+    # the Playwright driver). Linux only.
+    parents = {}
+    rss = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        parents[int(pid)] = int(fields["PPid"])
+        rss[int(pid)] = int(fields.get("VmRSS", "0 kB").split()[0])
+
+    total = 0
+    for pid in rss:
+        ancestor = parents.get(pid)
+        while ancestor and ancestor != os.getpid():
+            ancestor = parents.get(ancestor)
+        if ancestor == os.getpid():
+            total += rss[pid]
+    return total / 1024
+
+
+MODES = [
+    ("new_page_all_resources", False, False),
+    ("pooled_pages", True, False),
+    ("pooled_pages_blocked_resources", True, True),
+]
+
+
+def run(base_url: str, n_pages: int) -> dict:
+    urls = [f"{base_url}/page/{i}" for i in range(n_pages)]
+    report = {}
+    for name, reuse, block in MODES:
+        webscraper.reuse_pages = reuse
+        webscraper.block_resources = block
+        webscraper.close_playwright_context()
+        webscraper.render_html(urls[0])
+
+        peak_rss = 0.0
+        start = time.perf_counter()
+        for url in urls:
+            html, _ = webscraper.render_html(url)
+            if not html:
+                raise RuntimeError(f"render failed for {url}")
+            peak_rss = max(peak_rss, browser_rss_mb())
+        elapsed = time.perf_counter() - start
+        webscraper.close_playwright_context()
+
+        report[name] = {"pages_per_sec": n_pages / elapsed, "peak_browser_rss_mb": peak_rss}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render throughput and memory with page pooling and resource blocking.")
+    parser.add_argument("--pages", type=int, default=30)
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server()
+    try:
+        print(json.dumps(run(base_url, args.pages), indent=2))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+import concurrent.futures
+from collections import Counter
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from profiling import percentile
+from serve import MicroBatcher, create_server
+
+INPUT_FILE = "leaderboard_queries.json"
+MODEL_ID = "sshleifer/tiny-gpt2"
+SEED = 0
+CHUNKS = [
+    ("Carnegie Mellon University", "Carnegie Mellon University was founded in 1900 by Andrew Carnegie as the "
+                                   "Carnegie Technical Schools and merged with the Mellon Institute in 1967."),
+    ("Pittsburgh", "Pittsburgh sits where the Allegheny and Monongahela rivers join to form the Ohio River."),
+    ("Pittsburgh Steelers", "The Pittsburgh Steelers play at Acrisure Stadium and have won six Super Bowls."),
+    ("Picklesburgh", "Picklesburgh is a summer festival in downtown Pittsburgh celebrating pickles."),
+    ("Heinz History Center", "The Senator John Heinz History Center is a Smithsonian affiliate in the Strip District."),
+]
+
+
+class StubRetriever:
+    # Fixed chunks in place of CustomHybridRetriever, so the server runs
+    # without an index and the numbers are about batching, not search.
+    # While `gate` is cleared, search() blocks and holds the batcher's
+    # worker, which lets run_overload fill the queue deterministically.
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.blocked = threading.Event()
+
+    def search(self, query, top_k=5, rrf_k=60):
+        if not self.gate.is_set():
+            self.blocked.set()
+            self.gate.wait()
+        return [{"chunk": chunk, "metadata": {"title": title, "url": f"https://example.org/{i}"}}
+                for i, (title, chunk) in enumerate(CHUNKS[:top_k])]
+
+
+def _request(base_url, path, question=None):
+    # (status, headers, JSON body); error statuses are returned, not raised.
+    data = None if question is None else json.dumps({"question": question}).encode("utf-8")
+    request = urllib.request.Request(base_url + path, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.status, dict(response.headers), json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), json.loads(e.read())
+
+
+def start_server(retriever, tokenizer, model, **batching):
+    batcher = MicroBatcher(retriever, tokenizer, model, **batching).start()
+    server = create_server(batcher, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return batcher, server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def stop_server(batcher, server):
+    server.shutdown()
+    server.server_close()
+    batcher.stop()
+
+
+def run_load(retriever, tokenizer, model, questions, max_batch_size, concurrency, max_wait_ms):
+    # `concurrency` clients POST every question to /ask at once; the
+    # batcher's own /metrics says how many requests each batch held.
+    batcher, server, base_url = start_server(retriever, tokenizer, model, max_batch_size=max_batch_size,
+                                             max_wait_ms=max_wait_ms, max_queue=len(questions))
+    try:
+        _request(base_url, "/ask", questions[0])
+        torch.manual_seed(SEED)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda q: _request(base_url, "/ask", q), questions))
+        elapsed = time.perf_counter() - start
+        metrics = _request(base_url, "/metrics")[2]
+    finally:
+        stop_server(batcher, server)
+
+    statuses = Counter(status for status, _, _ in results)
+    if set(statuses) != {200}:
+        raise RuntimeError(f"expected every request to succeed, got statuses {dict(statuses)}")
+    latencies = sorted(body["latency_ms"] for _, _, body in results)
+    # The warm-up request is its own batch of one.
+    mean_batch_size = (metrics["batched_requests"] - 1) / (metrics["batches"] - 1)
+    if max_batch_size > 1 and concurrency > 1 and mean_batch_size <= 1:
+        raise RuntimeError("concurrent requests were never batched together")
+    return {
+        "requests": len(questions),
+        "answers_per_sec": len(questions) / elapsed,
+        "total_s": elapsed,
+        "latency_p50_ms": percentile(latencies, 0.50),
+        "latency_p95_ms": percentile(latencies, 0.95),
+        "batches": metrics["batches"] - 1,
+        "mean_batch_size": mean_batch_size,
+    }
+
+
+def run_overload(retriever, tokenizer, model, questions, max_queue):
+    # Holds the worker inside retrieval, fills the queue, and checks the
+    # next request is shed with a 503 while the queued ones still get
+    # answered once the worker is released.
+    batcher, server, base_url = start_server(retriever, tokenizer, model, max_batch_size=1, max_queue=max_queue)
+    retriever.blocked.clear()
+    retriever.gate.clear()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_queue + 1) as executor:
+            held = [executor.submit(_request, base_url, "/ask", questions[0])]
+            if not retriever.blocked.wait(timeout=60):
+                raise RuntimeError("the batcher never picked up the first request")
+            held += [executor.submit(_request, base_url, "/ask", q) for q in questions[1:max_queue + 1]]
+            deadline = time.perf_counter() + 60
+            while batcher.requests.qsize() < max_queue:
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("the request queue never filled up")
+                time.sleep(0.01)
+            status, headers, body = _request(base_url, "/ask", questions[0])
+            health = _request(base_url, "/health")[2]
+            retriever.gate.set()
+            statuses = Counter(future.result()[0] for future in held)
+        metrics = _request(base_url, "/metrics")[2]
+    finally:
+        retriever.gate.set()
+        stop_server(batcher, server)
+
+    if status != 503 or headers.get("Retry-After") is None:
+        raise RuntimeError(f"expected a 503 with Retry-After on a full queue, got {status} {body}")
+    if set(statuses) != {200}:
+        raise RuntimeError(f"expected the queued requests to succeed, got statuses {dict(statuses)}")
+    if metrics["rejected"] != 1 or metrics["requests"] != max_queue + 1 or metrics["queue_capacity"] != max_queue:
+        raise RuntimeError(f"/metrics does not match the requests sent: {metrics}")
+    return {
+        "full_queue_status": status,
+        "retry_after": headers["Retry-After"],
+        "queue_depth_when_full": health["queue_depth"],
+        "queued_answered": sum(statuses.values()),
+        "metrics": metrics,
+    }
+
+
+def run(tokenizer, model, questions, batch_sizes=(1, 8), concurrency=16, max_wait_ms=20, max_queue=4):
+    retriever = StubRetriever()
+    report = {}
+    for max_batch_size in batch_sizes:
+        report[f"batch_{max_batch_size}"] = run_load(retriever, tokenizer, model, questions, max_batch_size,
+                                                    concurrency, max_wait_ms)
+    if len(batch_sizes) > 1:
+        smallest, largest = report[f"batch_{min(batch_sizes)}"], report[f"batch_{max(batch_sizes)}"]
+        report["batching_answers_per_sec_speedup"] = largest["answers_per_sec"] / smallest["answers_per_sec"]
+    report["overload"] = run_overload(retriever, tokenizer, model, questions, max_queue)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive serve.py's micro-batcher over HTTP with a stub retriever.")
+    parser.add_argument("--model", default=MODEL_ID, help="causal LM to serve (from the local HF cache)")
+    parser.add_argument("--requests", type=int, default=32, help="leaderboard questions sent per configuration")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients sending requests at once")
+    parser.add_argument("--batch-sizes", default="1,8", help="comma-separated --max-batch-size values to compare")
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--max-queue", type=int, default=4, help="queue capacity for the overload check")
+    args = parser.parse_args()
+
+    torch.manual_seed(SEED)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32)
+    model.eval()
+    with open(INPUT_FILE, "r") as f:
+        questions = [item["question"] for item in json.load(f)][:args.requests]
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    print(json.dumps(run(tokenizer, model, questions, batch_sizes, args.concurrency, args.max_wait_ms,
+                         args.max_queue), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import time
+import json
+import argparse
+import torch
+from generate import _retrieve_prompt, _prepare_batch_tokenizer, _generate_batch, _trim_answer
+from process import CustomHybridRetriever
+from profiling import profiler
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+INPUT_FILE = "leaderboard_queries.json"
+MODEL_ID = "meta-llama/Llama-3.2-3B-Instruct"
+DRAFT_MODEL_ID = "meta-llama/Llama-3.2-1B-Instruct"
+# (answer, first sentence): where _trim_answer must cut with max_sentences=1.
+# The early-stop comparisons below are only meaningful if these hold.
+TRIM_EXAMPLES = [
+    ("H. J. Heinz founded the company in 1869. It makes ketchup.", "H. J. Heinz founded the company in 1869."),
+    ("Andrew W. Mellon funded it. He was a banker.", "Andrew W. Mellon funded it."),
+    ("It is on St. Patrick Street. It opened in 1895.", "It is on St. Patrick Street."),
+    ("No. It closed in 1987. It reopened later.", "No."),
+    ("No. 5 was retired in 1990. It was his number.", "No. 5 was retired in 1990."),
+    ("It is the oldest zoo in the U.S. It opened in 1898.", "It is the oldest zoo in the U.S."),
+    ("It moved to Washington, D.C. in 1990. Later it returned.", "It moved to Washington, D.C. in 1990."),
+]
+
+
+def _sync(model):
+    if model.device.type == "cuda":
+        torch.cuda.synchronize(model.device)
+
+
+def decode_all(prompts, tokenizer, model, **decoding):
+    # One prompt at a time (assisted generation cannot batch) and without
+    # prefix reuse, so every mode prefills the same way. Output tokens come
+    # from the profiler's counter.
+    profiler.reset()
+    answers = []
+    _sync(model)
+    start = time.perf_counter()
+    for prompt in prompts:
+        answers.extend(_generate_batch([prompt], tokenizer, model, reuse_prefix=False, greedy=True, **decoding))
+    _sync(model)
+    elapsed = time.perf_counter() - start
+    tokens = profiler.summary()["counters"].get("output_tokens", 0)
+    return answers, {"total_s": elapsed, "output_tokens": tokens, "tokens_per_sec": tokens / elapsed,
+                     "answers_per_sec": len(prompts) / elapsed}
+
+
+def check_trim_examples():
+    for answer, expected in TRIM_EXAMPLES:
+        trimmed = _trim_answer(answer, max_sentences=1)
+        if trimmed != expected:
+            raise RuntimeError(f"_trim_answer({answer!r}) gave {trimmed!r}, expected {expected!r}")
+
+
+def run(prompts, tokenizer, model, assistant_model, max_sentences=2, stop_on_newline=True):
+    check_trim_examples()
+    _prepare_batch_tokenizer(tokenizer)
+    profiler.enable()
+    # Warm up kernels for both paths outside the timed region.
+    _generate_batch(prompts[:1], tokenizer, model, reuse_prefix=False, greedy=True, max_new_tokens=8)
+    _generate_batch(prompts[:1], tokenizer, model, reuse_prefix=False, greedy=True, max_new_tokens=8,
+                    assistant_model=assistant_model)
+
+    stop = {"max_sentences": max_sentences, "stop_on_newline": stop_on_newline}
+    greedy, report_greedy = decode_all(prompts, tokenizer, model)
+    assisted, report_assisted = decode_all(prompts, tokenizer, model, assistant_model=assistant_model)
+    stopped, report_stopped = decode_all(prompts, tokenizer, model, **stop)
+    both, report_both = decode_all(prompts, tokenizer, model, assistant_model=assistant_model, **stop)
+
+    # Greedy answers cut at the same stopping point: what early stopping
+    # should reproduce without decoding the rest.
+    greedy_trimmed = [_trim_answer(answer, **stop) for answer in greedy]
+    match = lambda a, b: sum(x == y for x, y in zip(a, b)) / len(a)
+    report = {
+        "greedy": report_greedy,
+        "greedy_assisted": {**report_assisted, "matches_greedy": match(assisted, greedy)},
+        "greedy_early_stop": {**report_stopped, "matches_trimmed_greedy": match(stopped, greedy_trimmed)},
+        "greedy_assisted_early_stop": {**report_both, "matches_trimmed_greedy": match(both, greedy_trimmed)},
+    }
+    report["assisted_tokens_per_sec_speedup"] = report_assisted["tokens_per_sec"] / report_greedy["tokens_per_sec"]
+    report["early_stop_answers_per_sec_speedup"] = report_stopped["answers_per_sec"] / report_greedy["answers_per_sec"]
+    report["combined_answers_per_sec_speedup"] = report_both["answers_per_sec"] / report_greedy["answers_per_sec"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Speculative decoding and early stopping versus plain greedy decoding.")
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--assistant-model", default=DRAFT_MODEL_ID, help="draft model sharing --model's tokenizer")
+    parser.add_argument("--index", default="rag_index")
+    parser.add_argument("--limit", type=int, default=50, help="number of leaderboard queries to decode")
+    parser.add_argument("--max-sentences", type=int, default=2)
+    args = parser.parse_args()
+
+    retriever = CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2')
+    retriever.load_index(args.index)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model, assistant_model = [
+        AutoModelForCausalLM.from_pretrained(
+            model_id,
+            device_map="auto",
+            torch_dtype=torch.bfloat16,
+            trust_remote_code=True
+        )
+        for model_id in (args.model, args.assistant_model)
+    ]
+
+    with open(INPUT_FILE, "r") as f:
+        queries = json.load(f)[:args.limit]
+    prompts = [_retrieve_prompt(item["question"], retriever, tokenizer) for item in queries]
+
+    print(json.dumps(run(prompts, tokenizer, model, assistant_model, max_sentences=args.max_sentences), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import concurrent.futures
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler
+import webscraper
+from bench_extract import load_fixtures, run as run_extract, FIXTURE_DIR
+from bench_render import start_fixture_server
+from retrieval_cache import CachedRetriever
+from profiling import percentile
+
+INPUT_FILE = "leaderboard_queries.json"
+OUTPUT_FILE = "output/bench_results.json"
+TINY_MODEL_ID = "sshleifer/tiny-gpt2"
+SEED = 0
+GENERATION_TOKENS = 100
+# Per-chunk token counts can differ slightly from the joined prompt's.
+CONTEXT_SLACK_TOKENS = 16
+
+# Metric name suffixes that say which direction is better; other numbers
+# (page counts, corpus sizes) are context and never compared.
+HIGHER_IS_BETTER = ("_per_sec", "_speedup", "_qps")
+LOWER_IS_BETTER = ("_ms", "_s")
+
+
+def _percentiles_ms(timings):
+    ordered = sorted(timings)
+    pick = lambda q: 1000 * percentile(ordered, q)
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "mean_ms": 1000 * statistics.mean(ordered)}
+
+
+# ---------------------------------------------------------------- crawler
+
+def recorded_site_handler(pages, copies):
+    # Serves the recorded HTML fixtures as a small site: "/" links to
+    # `copies` distinct URLs per fixture, so a depth-1 crawl fetches and
+    # parses len(pages) * copies real-world pages without a network.
+    bodies = {}
+    for url, html in pages:
+        name = url.rsplit("/", 1)[-1]
+        for i in range(copies):
+            bodies[f"/site/{i}/{name}"] = html.encode("utf-8")
+    links = "\n".join(f'<li><a href="{path}">{path}</a></li>' for path in sorted(bodies))
+    paragraphs = "\n".join(
+        f"<p>Recorded fixture index for the offline crawler benchmark, section {i}, covering Pittsburgh "
+        f"events, history and institutions.</p>" for i in range(10)
+    )
+    bodies["/"] = f"<html><head><title>Fixture index</title></head><body><main>{paragraphs}<ul>{links}</ul></main></body></html>".encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = bodies.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler, len(bodies) - 1
+
+
+def run_crawler(pages, copies, workers, parse_workers):
+    handler, n_pages = recorded_site_handler(pages, copies)
+    server, base_url = start_fixture_server(handler)
+    report = {"site_pages": n_pages}
+    try:
+        urls = [f"{base_url}/site/{i}/{url.rsplit('/', 1)[-1]}" for url, _ in pages for i in range(copies)]
+
+        webscraper.fetch_stats.clear()
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            htmls = list(executor.map(webscraper.fetch_html, urls))
+        report["fetch_pages_per_sec"] = len(urls) / (time.perf_counter() - start)
+        if not all(htmls):
+            raise RuntimeError("fixture server returned an empty page")
+
+        webscraper.visited_urls.clear()
+        scraper = webscraper.WebScraper({"fixture": base_url + "/"}, max_depth=1, max_workers=workers,
+                                        parse_workers=parse_workers, request_delay=0.0)
+        start = time.perf_counter()
+        scraper.scrape()
+        elapsed = time.perf_counter() - start
+        report["scrape_pages_per_sec"] = (n_pages + 1) / elapsed
+        report["scrape_total_s"] = elapsed
+        report["documents_kept"] = len(scraper.documents)
+
+        # The engine webscraper.py's __main__ runs. The fixture pages all
+        # take the HTTP path, so no browser is launched.
+        webscraper.visited_urls.clear()
+        scraper = webscraper.AsyncWebScraper({"fixture": base_url + "/"}, max_depth=1, max_concurrency=workers,
+                                             per_host_concurrency=workers, host_delay=0.0, parse_workers=parse_workers)
+        start = time.perf_counter()
+        scraper.scrape()
+        elapsed = time.perf_counter() - start
+        report["async_scrape_pages_per_sec"] = (n_pages + 1) / elapsed
+        report["async_scrape_total_s"] = elapsed
+        report["async_documents_kept"] = len(scraper.documents)
+        if report["async_documents_kept"] != report["documents_kept"]:
+            raise RuntimeError("AsyncWebScraper kept a different number of documents than WebScraper")
+        modes = Counter()
+        for stats in webscraper.fetch_stats.values():
+            modes.update(stats)
+        report["fetch_modes"] = dict(modes)
+    finally:
+        server.shutdown()
+        webscraper.visited_urls.clear()
+    return report
+
+
+# -------------------------------------------------------------- retrieval
+
+def _query_words(question):
+    return "".join(ch if ch.isalnum() else " " for ch in question.lower()).split()
+
+
+class SyntheticRetriever:
+    # Stand-in for CustomHybridRetriever over a generated corpus: Okapi BM25
+    # on an inverted index, with the same search() signature and result
+    # shape ({"chunk", "metadata": {"title", "url"}}). Documents are built
+    # from the leaderboard questions' vocabulary plus filler words, so the
+    # benchmark queries hit realistic posting lists.
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, vocabulary, n_docs=2000, chunks_per_doc=4, chunk_words=120, seed=SEED):
+        rng = random.Random(seed)
+        filler = [f"w{i}" for i in range(5000)]
+        self.chunks = []
+        self.metadata = []
+        for d in range(n_docs):
+            topic = rng.sample(vocabulary, min(20, len(vocabulary)))
+            for c in range(chunks_per_doc):
+                words = [rng.choice(topic) if rng.random() < 0.3 else rng.choice(filler) for _ in range(chunk_words)]
+                self.chunks.append(" ".join(words))
+                self.metadata.append({"title": f"Synthetic document {d}", "url": f"https://synthetic.local/{d}"})
+
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for chunk_id, chunk in enumerate(self.chunks):
+            terms = chunk.split()
+            self.lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((chunk_id, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths)
+        n = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(posts) + 0.5) / (len(posts) + 0.5)) for term, posts in self.postings.items()
+        }
+
+    def load_index(self, path):
+        pass
+
+    def search(self, query, top_k=5, rrf_k=60):
+        scores = defaultdict(float)
+        for term in set(_query_words(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / self.avg_length)
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+        return [{"chunk": self.chunks[i], "metadata": self.metadata[i], "score": s} for i, s in best]
+
+
+def load_questions(path=INPUT_FILE):
+    with open(path, "r") as f:
+        return [item["question"] for item in json.load(f)]
+
+
+def synthetic_retriever(questions, n_docs):
+    vocabulary = sorted({word for q in questions for word in _query_words(q)})
+    return SyntheticRetriever(vocabulary, n_docs=n_docs)
+
+
+def run_retrieval(retriever, questions, workers):
+    queries = questions
+    report = {}
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.search(query, top_k=5, rrf_k=60)
+        timings.append(time.perf_counter() - start)
+    report["search"] = {**_percentiles_ms(timings), "search_qps": len(queries) / sum(timings)}
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda q: retriever.search(q, top_k=5, rrf_k=60), queries))
+    report["search"][f"threads_{workers}_qps"] = len(queries) / (time.perf_counter() - start)
+
+    cached = CachedRetriever(retriever)
+    for query in queries:
+        cached.search(query, top_k=5, rrf_k=60)
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        cached.search(query, top_k=5, rrf_k=60)
+        timings.append(time.perf_counter() - start)
+    report["cached_search"] = {**_percentiles_ms(timings), "search_qps": len(queries) / sum(timings)}
+    return report
+
+
+def real_retriever(index_path):
+    from process import CustomHybridRetriever
+
+    retriever = CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2')
+    start = time.perf_counter()
+    retriever.load_index(index_path)
+    return retriever, time.perf_counter() - start
+
+
+# ------------------------------------------------------------- generation
+
+def run_generation(retriever, questions, model_id, batch_sizes):
+    # Torch, transformers and generate.py are imported here so the crawler
+    # and retrieval sections run without them.
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    from generate import generate_answers, build_prompt
+
+    torch.manual_seed(SEED)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(model_id, torch_dtype=torch.float32)
+    model.eval()
+    items = [(str(i), q) for i, q in enumerate(questions)]
+
+    # Small models have short position tables (tiny-gpt2: 1024), so size the
+    # context budget to what is left after the instructions, the longest
+    # question and the answer.
+    max_positions = getattr(model.config, "n_positions", None) or model.config.max_position_embeddings
+    overhead = max(len(tokenizer(build_prompt(q, []))["input_ids"]) for q in questions)
+    max_context_tokens = max_positions - overhead - GENERATION_TOKENS - CONTEXT_SLACK_TOKENS
+    if max_context_tokens <= 0:
+        raise ValueError(f"{model_id} has {max_positions} positions, too few for a {overhead}-token prompt "
+                         f"and a {GENERATION_TOKENS}-token answer")
+    decoding = {"max_context_tokens": max_context_tokens, "max_new_tokens": GENERATION_TOKENS}
+
+    report = {"model": model_id, "queries": len(items), "max_context_tokens": max_context_tokens}
+    list(generate_answers(items[:2], retriever, tokenizer, model, batch_size=2, **decoding))
+    for batch_size in batch_sizes:
+        torch.manual_seed(SEED)
+        start = time.perf_counter()
+        answers = list(generate_answers(items, retriever, tokenizer, model, batch_size=batch_size, **decoding))
+        elapsed = time.perf_counter() - start
+        report[f"batch_{batch_size}"] = {"answers_per_sec": len(answers) / elapsed, "total_s": elapsed}
+    return report
+
+
+# --------------------------------------------------------------- compare
+
+def flatten(report, prefix=""):
+    metrics = {}
+    for key, value in report.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = float(value)
+    return metrics
+
+
+def compare(current, baseline, tolerance):
+    # A metric regresses when it moves the wrong way by more than
+    # `tolerance` (relative). Metrics missing on either side are skipped.
+    current, baseline = flatten(current["results"]), flatten(baseline["results"])
+    rows = []
+    for name in sorted(set(current) & set(baseline)):
+        leaf = name.rsplit(".", 1)[-1]
+        if leaf.endswith(HIGHER_IS_BETTER):
+            higher = True
+        elif leaf.endswith(LOWER_IS_BETTER):
+            higher = False
+        else:
+            continue
+        old, new = baseline[name], current[name]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher else change > tolerance
+        rows.append({"metric": name, "baseline": old, "current": new, "change": change, "regressed": regressed})
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the crawler, retrieval and generation.")
+    parser.add_argument("--sections", default="crawler,retrieval,generation",
+                        help="comma-separated subset of crawler,retrieval,generation")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored results file")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change allowed before a metric counts as a regression")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--copies", type=int, default=20, help="copies of each recorded page on the fixture site")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--extract-repeat", type=int, default=5)
+    parser.add_argument("--corpus-docs", type=int, default=2000, help="documents in the synthetic retrieval corpus")
+    parser.add_argument("--index", help="benchmark CustomHybridRetriever on this index instead of the synthetic corpus")
+    parser.add_argument("--model", default=TINY_MODEL_ID, help="causal LM for the generation section (from the local HF cache)")
+    parser.add_argument("--limit", type=int, default=32, help="leaderboard queries used for generation")
+    parser.add_argument("--batch-sizes", default="1,8")
+    args = parser.parse_args()
+
+    sections = {s.strip() for s in args.sections.split(",") if s.strip()}
+    random.seed(SEED)
+    questions = load_questions()
+    results = {}
+
+    if "crawler" in sections:
+        pages = load_fixtures(args.fixtures)
+        results["crawler"] = run_crawler(pages, args.copies, args.workers, args.parse_workers)
+        results["extract"] = run_extract(pages, args.extract_repeat, args.parse_workers)
+
+    retriever = None
+    if "retrieval" in sections or "generation" in sections:
+        if args.index:
+            retriever, load_s = real_retriever(args.index)
+            retrieval_info = {"retriever": "CustomHybridRetriever", "index": args.index, "load_index_s": load_s}
+        else:
+            start = time.perf_counter()
+            retriever = synthetic_retriever(questions, args.corpus_docs)
+            retrieval_info = {"retriever": "synthetic_bm25", "chunks": len(retriever.chunks),
+                              "build_index_s": time.perf_counter() - start}
+        if "retrieval" in sections:
+            results["retrieval"] = {**retrieval_info, **run_retrieval(retriever, questions, args.workers)}
+
+    if "generation" in sections:
+        batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+        results["generation"] = run_generation(retriever, questions[:args.limit], args.model, batch_sizes)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": SEED,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.tolerance)
+        regressions = [row for row in rows if row["regressed"]]
+        for row in rows:
+            flag = "REGRESSION" if row["regressed"] else "ok"
+            print(f"{flag:<10} {row['metric']:<55} {row['baseline']:>12.3f} -> {row['current']:>12.3f} ({row['change']:+.1%})")
+        print(f"{len(regressions)} regressions out of {len(rows)} compared metrics (tolerance {args.tolerance:.0%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
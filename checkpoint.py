@@ -0,0 +1,55 @@
+import os
+import json
+
+
+def load_checkpoint(path):
+    answers = {}
+    if not os.path.exists(path):
+        return answers
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line; that
+                # answer is simply regenerated on resume.
+                continue
+            answers[record["id"]] = record["answer"]
+    return answers
+
+
+def open_checkpoint(path, resume=False):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not resume:
+        return open(path, "w", encoding="utf-8")
+
+    # Terminate a truncated last line so the next record starts cleanly.
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb+") as raw:
+            raw.seek(-1, os.SEEK_END)
+            if raw.read(1) != b"\n":
+                raw.write(b"\n")
+    return open(path, "a", encoding="utf-8")
+
+
+def append_checkpoint(f, qid, answer):
+    f.write(json.dumps({"id": qid, "answer": answer}, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def write_answers(checkpoint_path, output_path, andrew_id, qids):
+    answers = load_checkpoint(checkpoint_path)
+    missing = [qid for qid in qids if qid not in answers]
+    if missing:
+        print(f"Warning: {len(missing)} queries have no answer in {checkpoint_path}")
+
+    results = {"andrewid": andrew_id}
+    for qid in qids:
+        results[qid] = answers.get(qid, "")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    return results
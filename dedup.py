@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)} if words else set()
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    # 32-bit hashes keep a * h + b inside uint64 for the permutations below.
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+
+
+def _lsh_bands(num_perm: int, threshold: float) -> tuple:
+    # Pick bands x rows so the LSH candidate threshold (1/b)^(1/r) sits just
+    # below the similarity threshold: high recall, few false candidates.
+    best = (num_perm, 1)
+    best_t = 0.0
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        t = (1.0 / bands) ** (1.0 / rows)
+        if best_t < t <= threshold:
+            best, best_t = (bands, rows), t
+    return best
+
+
+class NearDuplicateIndex:
+    # MinHash signatures over word 5-shingles with banded LSH lookup, so
+    # checking a document costs O(shingles + candidates) instead of a scan
+    # of the corpus. Signatures persist to `path`, which lets incremental
+    # crawls dedupe against documents kept by earlier runs.
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM, path: str = None):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.path = path
+        self.bands, self.rows = _lsh_bands(num_perm, threshold)
+        rng = np.random.RandomState(1)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.urls: List[str] = []
+        self.signatures: List[np.ndarray] = []
+        self._url_ids: Dict[str, int] = {}
+        self._buckets = [dict() for _ in range(self.bands)]
+        self.dropped: List[Dict] = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = _shingle_hashes(text)
+        if hashes.size == 0:
+            return None
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, url: str, signature: np.ndarray):
+        doc_id = len(self.urls)
+        self.urls.append(url)
+        self.signatures.append(signature)
+        self._url_ids[url] = doc_id
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(key, []).append(doc_id)
+
+    def check(self, doc: Dict) -> tuple:
+        # Returns (kept_url, similarity) when doc near-duplicates a document
+        # already in the index, else adds doc and returns (None, 0.0).
+        url = doc["url"]
+        signature = self.signature(doc.get("text") or "")
+        if signature is None:
+            return None, 0.0
+        with self._lock:
+            if url in self._url_ids:
+                return None, 0.0
+            candidates = set()
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(band.get(key, ()))
+            best_id, best_sim = None, 0.0
+            for doc_id in candidates:
+                sim = float(np.mean(self.signatures[doc_id] == signature))
+                if sim > best_sim:
+                    best_id, best_sim = doc_id, sim
+            if best_id is not None and best_sim >= self.threshold:
+                kept = self.urls[best_id]
+                self.dropped.append({"url": url, "duplicate_of": kept, "similarity": round(best_sim, 3)})
+                return kept, best_sim
+            self._insert(url, signature)
+        return None, 0.0
+
+    def is_duplicate(self, doc: Dict) -> bool:
+        kept, sim = self.check(doc)
+        if kept is None:
+            return False
+        logger.info(f"Dropped near-duplicate ({sim:.2f}): {doc['url']} ~ {kept}")
+        return True
+
+    def save(self, path: str = None):
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            signatures = np.array(self.signatures, dtype=np.uint64).reshape(-1, self.num_perm)
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, urls=np.array(self.urls, dtype=object), signatures=signatures,
+                     threshold=self.threshold, num_perm=self.num_perm)
+        os.replace(tmp_path, path)
+
+    def _load(self, path: str):
+        data = np.load(path, allow_pickle=True)
+        if int(data["num_perm"]) != self.num_perm:
+            logger.warning(f"Ignoring fingerprint index {path}: built with num_perm={int(data['num_perm'])}")
+            return
+        for url, signature in zip(data["urls"], data["signatures"]):
+            self._insert(str(url), signature)
+        logger.info(f"Loaded {len(self.urls)} fingerprints from {path}")
+
+    def write_report(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.dropped, f, indent=2, ensure_ascii=False)
+        logger.info(f"Near-duplicate filter dropped {len(self.dropped)} documents; report in {path}")
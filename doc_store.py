@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:24]
+
+
+class DocumentStore:
+    # Append-only JSONL corpus, one scraped document per line. A sidecar
+    # "<path>.idx" file maps URL hashes to byte offsets, so opening a store
+    # only loads the index: membership checks and single-document lookups
+    # never read the whole corpus into memory.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.offsets = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._load_index()
+        self._recover()
+        self._data = open(path, "ab")
+        self._index = open(self.index_path, "a", encoding="utf-8")
+        self._reader = open(path, "rb")
+
+    def _load_index(self):
+        # An unterminated last line is a write cut short: its offset may be
+        # missing digits, and the next append would run onto it. Drop it;
+        # _recover re-indexes that document from the data file.
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                data = data[:data.rfind(b"\n") + 1]
+                f.truncate(len(data))
+                logger.warning(f"Dropped truncated entry at end of {self.index_path}")
+        for line in data.decode("utf-8").splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                self.offsets[parts[0]] = int(parts[1])
+
+    def _recover(self):
+        # Re-index documents written after the last index entry (a crash
+        # between the two writes) and drop a truncated final line.
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            start = 0
+            if self.offsets:
+                f.seek(max(self.offsets.values()))
+                f.readline()
+                start = f.tell()
+            f.seek(start)
+            recovered = []
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    f.truncate(offset)
+                    logger.warning(f"Dropped truncated document at end of {self.path}")
+                    break
+                doc = json.loads(line)
+                recovered.append((url_key(doc["url"]), offset))
+        if recovered:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for key, offset in recovered:
+                    self.offsets[key] = offset
+                    f.write(f"{key} {offset}\n")
+            logger.info(f"Re-indexed {len(recovered)} documents in {self.path}")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __contains__(self, url: str) -> bool:
+        return url_key(url) in self.offsets
+
+    def append(self, doc: Dict) -> bool:
+        key = url_key(doc["url"])
+        line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if key in self.offsets:
+                return False
+            offset = self._data.seek(0, os.SEEK_END)
+            self._data.write(line)
+            self._data.flush()
+            self._index.write(f"{key} {offset}\n")
+            self._index.flush()
+            self.offsets[key] = offset
+        return True
+
+    def get(self, url: str) -> Dict:
+        offset = self.offsets.get(url_key(url))
+        if offset is None:
+            return None
+        with self._lock:
+            self._reader.seek(offset)
+            line = self._reader.readline()
+        return json.loads(line)
+
+    def __iter__(self) -> Iterator[Dict]:
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+        self._reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_json_to_jsonl(json_paths: List[str], jsonl_path: str) -> DocumentStore:
+    # One-time migration of scraped_documents_N.json outputs.
+    store = DocumentStore(jsonl_path)
+    for json_path in json_paths:
+        with open(json_path, "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        added = sum(1 for doc in documents if "url" in doc and store.append(doc))
+        logger.info(f"Converted {added}/{len(documents)} documents from {json_path} into {jsonl_path}")
+    return store
+
+
+def export_json(jsonl_path: str, json_path: str):
+    # Writes the list-of-documents JSON that the indexing step reads, one
+    # document at a time.
+    with DocumentStore(jsonl_path) as store, open(json_path, "w", encoding="utf-8") as out:
+        out.write("[")
+        for i, doc in enumerate(store):
+            out.write(",\n" if i else "\n")
+            out.write(json.dumps(doc, indent=2, ensure_ascii=False))
+        out.write("\n]\n")
+    logger.info(f"Exported {jsonl_path} to {json_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    usage = "usage: python doc_store.py convert IN.json [IN.json ...] OUT.jsonl | export IN.jsonl OUT.json"
+    if len(sys.argv) >= 4 and sys.argv[1] == "convert":
+        convert_json_to_jsonl(sys.argv[2:-1], sys.argv[-1]).close()
+    elif len(sys.argv) == 4 and sys.argv[1] == "export":
+        export_json(sys.argv[2], sys.argv[3])
+    else:
+        print(usage)
+        sys.exit(1)
@@ -1,15 +1,16 @@
+import re
+import copy
+import time
+import queue
+import weakref
+import threading
+import concurrent.futures
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from process import CustomHybridRetriever, TextProcessor
-def build_prompt(query, results):
-    context_text = ""
-    for i, res in enumerate(results):
-        title = res['metadata'].get('title', 'Unknown Source')
-        chunk = res['chunk']
-        
-        context_text += f"--- Source {i+1}: {title} ---\n"
-        context_text += f"{chunk}\n\n"
-    prompt =f"""You are a precise factual question-answering system specialized in Pittsburgh knowledge.
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+from retrieval_cache import CachedRetriever
+from profiling import profiler
+PROMPT_PREFIX = """You are a precise factual question-answering system specialized in Pittsburgh knowledge.
 
 Goal:
 Provide the most accurate answer possible using the context. Your response will be graded for factual correctness, completeness, and overlap with reference answers.
@@ -28,7 +29,19 @@ Rules:
 
 
 Context:
-{context_text}
+"""
+
+def build_prompt(query, results):
+    context_text = ""
+    for i, res in enumerate(results):
+        title = res['metadata'].get('title', 'Unknown Source')
+        chunk = res['chunk']
+        
+        context_text += f"--- Source {i+1}: {title} ---\n"
+        context_text += f"{chunk}\n\n"
+    # Everything that varies per query comes after PROMPT_PREFIX so its KV
+    # cache can be computed once and shared (see _prefix_cache).
+    prompt = PROMPT_PREFIX + f"""{context_text}
 
 Question:
 {query}
@@ -37,36 +50,428 @@ Answer:"""
     return prompt
 
 
-def generate_answer(query, retriever, tokenizer, model):
-    results = retriever.search(query, top_k=5, rrf_k=60) 
+MAX_CONTEXT_TOKENS = 2000
+NEAR_DUPLICATE_JACCARD = 0.8
+
+# Fast tokenizers mutate their padding state during batch encoding, so calls
+# from the retrieval pool and the generation loop must not interleave.
+_tokenizer_lock = threading.Lock()
+
+
+def _tokenize(tokenizer, texts, **kwargs):
+    with _tokenizer_lock:
+        return tokenizer(texts, **kwargs)
+
+
+def _shingles(text, n=3):
+    words = text.lower().split()
+    if len(words) <= n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _is_near_duplicate(shingles, others):
+    for other in others:
+        overlap = len(shingles & other)
+        if overlap and overlap / len(shingles | other) >= NEAR_DUPLICATE_JACCARD:
+            return True
+    return False
+
+
+def select_context(results, tokenizer, max_context_tokens=MAX_CONTEXT_TOKENS):
+    # Keeps the retriever's RRF order, drops exact and near-duplicate chunks
+    # from the same page, then trims the lowest-ranked chunks until the
+    # context fits the token budget. Returns (kept results, tokens saved).
+    unique = []
+    seen_by_page = {}
+    for res in results:
+        page = res['metadata'].get('url') or res['metadata'].get('title')
+        shingles = _shingles(res['chunk'])
+        seen = seen_by_page.setdefault(page, [])
+        if _is_near_duplicate(shingles, seen):
+            continue
+        seen.append(shingles)
+        unique.append(res)
+
+    def source_text(i, res):
+        title = res['metadata'].get('title', 'Unknown Source')
+        return f"--- Source {i+1}: {title} ---\n{res['chunk']}\n\n"
+
+    # Kept chunks are always a prefix of `unique`, so pricing them by their
+    # position there matches build_prompt's numbering. Savings are measured
+    # against the prompt all results would have made.
+    texts = [source_text(i, res) for i, res in enumerate(results)]
+    texts += [source_text(i, res) for i, res in enumerate(unique)]
+    costs = [len(ids) for ids in _tokenize(tokenizer, texts, add_special_tokens=False)['input_ids']] if texts else []
+    total = sum(costs[:len(results)])
+
+    kept = []
+    used = 0
+    for res, cost in zip(unique, costs[len(results):]):
+        if used + cost > max_context_tokens:
+            if not kept:
+                # Never drop the top-ranked chunk entirely; cut it to fit,
+                # unless the budget cannot even hold its header.
+                ids = _tokenize(tokenizer, res['chunk'], add_special_tokens=False)['input_ids']
+                header = cost - len(ids)
+                if max_context_tokens > header:
+                    kept.append(dict(res, chunk=tokenizer.decode(ids[:max_context_tokens - header])))
+                    used = max_context_tokens
+            break
+        kept.append(res)
+        used += cost
+    return kept, total - used
+
+
+def _retrieve_prompt(query, retriever, tokenizer=None, max_context_tokens=MAX_CONTEXT_TOKENS):
+    with profiler.span("retrieval"):
+        results = retriever.search(query, top_k=5, rrf_k=60)
+    # Timed by hand so each query's savings go on its trace event.
+    start = time.perf_counter()
+    context = {}
+    if tokenizer is not None:
+        kept, saved = select_context(results, tokenizer, max_context_tokens)
+        context = {"tokens_saved": saved, "chunks_dropped": len(results) - len(kept)}
+        profiler.count("context_tokens_saved", saved)
+        profiler.count("context_chunks_dropped", len(results) - len(kept))
+        results = kept
     prompt = build_prompt(query, results)
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    
-   
-    with torch.no_grad(): 
+    profiler.record("prompt_build", start, time.perf_counter() - start, query=query, **context)
+    return prompt
+
+
+def generate_answer(query, retriever, tokenizer, model, reuse_prefix=True, max_context_tokens=MAX_CONTEXT_TOKENS,
+                    **decoding):
+    prompt = _retrieve_prompt(query, retriever, tokenizer, max_context_tokens)
+    _prepare_batch_tokenizer(tokenizer)
+    answer = _generate_batch([prompt], tokenizer, model, reuse_prefix=reuse_prefix, **decoding)[0]
+
+    print("Answer:")
+    print(answer)
+
+    return answer
+
+
+def _prepare_batch_tokenizer(tokenizer):
+    # Decoder-only models must be left-padded so every row ends at the
+    # position generation continues from.
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+
+
+_prefix_caches = weakref.WeakKeyDictionary()
+
+
+def _prefix_cache(tokenizer, model):
+    # KV cache of PROMPT_PREFIX, computed once per model and copied per call.
+    entry = _prefix_caches.get(model)
+    if entry is None:
+        prefix_ids = _tokenize(tokenizer, PROMPT_PREFIX, return_tensors="pt")['input_ids'].to(model.device)
+        with profiler.span("prefix_cache", tokens=prefix_ids.shape[1]), torch.no_grad():
+            cache = model(prefix_ids, use_cache=True).past_key_values
+        if isinstance(cache, tuple):
+            cache = DynamicCache.from_legacy_cache(cache)
+        entry = (prefix_ids[0].tolist(), cache)
+        _prefix_caches[model] = entry
+    return entry
+
+
+def _prefixed_inputs(prompts, tokenizer, model):
+    # Builds inputs whose first tokens are exactly the cached prefix, padding
+    # each row between the prefix and its own suffix instead of on the far
+    # left. Returns None when a prompt does not tokenize to prefix + suffix,
+    # in which case the caller falls back to a plain prefill.
+    prefix_ids, prefix_cache = _prefix_cache(tokenizer, model)
+    n_prefix = len(prefix_ids)
+    suffixes = []
+    for ids in _tokenize(tokenizer, prompts)['input_ids']:
+        if ids[:n_prefix] != prefix_ids or len(ids) == n_prefix:
+            return None
+        suffixes.append(ids[n_prefix:])
+
+    width = max(len(suffix) for suffix in suffixes)
+    input_ids = []
+    attention_mask = []
+    for suffix in suffixes:
+        pad = width - len(suffix)
+        input_ids.append(prefix_ids + [tokenizer.pad_token_id] * pad + suffix)
+        attention_mask.append([1] * n_prefix + [0] * pad + [1] * len(suffix))
+
+    cache = copy.deepcopy(prefix_cache)
+    if len(prompts) > 1:
+        cache.batch_repeat_interleave(len(prompts))
+    inputs = {
+        'input_ids': torch.tensor(input_ids, device=model.device),
+        'attention_mask': torch.tensor(attention_mask, device=model.device),
+        'past_key_values': cache,
+    }
+    return inputs
+
+
+class _StageTimer(BaseStreamer):
+    # generate() puts the prompt ids once before prefill and then each
+    # step's new tokens, so the first and second puts bracket the prefill
+    # and the rest is decode.
+    def __init__(self):
+        self.start = None
+        self.first_token = None
+        self.done = None
+
+    def put(self, value):
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        elif self.first_token is None:
+            self.first_token = now
+
+    def end(self):
+        self.done = time.perf_counter()
+
+    def record(self, batch_size):
+        if self.start is None or self.first_token is None:
+            return
+        profiler.record("prefill", self.start, self.first_token - self.start, batch=batch_size)
+        profiler.record("decode", self.first_token, (self.done or self.first_token) - self.first_token, batch=batch_size)
+
+
+# A sentence ends at ., ! or ? (after any closing quotes/brackets) once the
+# next token has started with whitespace, so "3.5" mid-token does not count.
+# Periods after common abbreviations ("St.") don't either, nor "No." before
+# a number ("No. 5"). A single capital is an initial ("H. J. Heinz",
+# "Andrew W. Mellon") unless it ends an acronym or stands alone and a new
+# capitalized word that is not itself an initial follows ("in the U.S. It").
+_SENTENCE_END_RE = re.compile(r"(\w*)([.!?])[\"')\]]*\s")
+_ABBREVIATIONS = {"st", "mt", "ft", "dr", "mr", "mrs", "ms", "jr", "sr", "ave", "blvd", "vs", "inc", "co",
+                  "corp", "dept", "univ", "gov", "jan", "feb", "mar", "apr", "aug", "sept", "oct", "nov", "dec"}
+_NAME_BEFORE_RE = re.compile(r"(?:^|\s)(?:[A-Z]\.|[A-Z][\w'-]*)\s+$")
+_INITIAL_RE = re.compile(r"[A-Z]\.(?:\s|$)")
+
+
+def _period_ends_sentence(text, match):
+    word = match.group(1)
+    following = text[match.end():].lstrip()
+    if word.lower() == "no":
+        return bool(following) and not following[0].isdigit()
+    if word.lower() in _ABBREVIATIONS:
+        return False
+    if len(word) == 1 and word.isupper():
+        if _NAME_BEFORE_RE.search(text[:match.start(1)]):
+            return False
+        return following[:1].isupper() and not _INITIAL_RE.match(following)
+    return True
+
+
+def _sentence_ends(text):
+    return [
+        match.end() for match in _SENTENCE_END_RE.finditer(text)
+        if match.group(2) != "." or _period_ends_sentence(text, match)
+    ]
+
+
+def _answer_complete(text, max_sentences=None, stop_on_newline=False):
+    text = text.lstrip()
+    if stop_on_newline and "\n" in text:
+        return True
+    return bool(max_sentences) and len(_sentence_ends(text)) >= max_sentences
+
+
+def _trim_answer(text, max_sentences=None, stop_on_newline=False):
+    # Cuts what the stopping criterion let through after the answer ended.
+    text = text.strip()
+    if stop_on_newline:
+        text = text.split("\n", 1)[0].strip()
+    if max_sentences:
+        ends = _sentence_ends(text + " ")
+        if len(ends) >= max_sentences:
+            text = text[:ends[max_sentences - 1]].strip()
+    return text
+
+
+class AnswerStoppingCriteria(StoppingCriteria):
+    # Stops each row once its generated text holds a complete answer: a
+    # newline after some text, or max_sentences finished sentences. The
+    # prompt asks for 1-2 sentences, so decoding past that only produces
+    # text that gets trimmed.
+    def __init__(self, tokenizer, input_length, max_sentences=None, stop_on_newline=False):
+        self.tokenizer = tokenizer
+        self.input_length = input_length
+        self.max_sentences = max_sentences
+        self.stop_on_newline = stop_on_newline
+        self.done = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.done is None:
+            self.done = [False] * input_ids.shape[0]
+        for row, ids in enumerate(input_ids):
+            if not self.done[row]:
+                text = self.tokenizer.decode(ids[self.input_length:], skip_special_tokens=True)
+                self.done[row] = _answer_complete(text, self.max_sentences, self.stop_on_newline)
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+
+def _decoding_batch_size(batch_size, reuse_prefix, decoding):
+    # Assisted generation runs one sequence at a time, and the draft model
+    # would need its own copy of the prefix cache, so both are turned off.
+    if decoding.get("assistant_model") is not None:
+        return 1, False
+    return batch_size, reuse_prefix
+
+
+def _generate_batch(prompts, tokenizer, model, reuse_prefix=True, max_new_tokens=100, assistant_model=None,
+                    greedy=False, max_sentences=None, stop_on_newline=False):
+    # assistant_model: a small draft model sharing the tokenizer; generate()
+    # then verifies its proposed tokens in one forward pass of `model`
+    # (speculative decoding). greedy decodes deterministically, which with
+    # a draft model gives exactly the greedy output of `model` alone.
+    if assistant_model is not None:
+        if len(prompts) != 1:
+            raise ValueError("assisted generation needs batches of one prompt")
+        reuse_prefix = False
+
+    if reuse_prefix:
+        # First use runs a forward pass; keep it out of the tokenize span.
+        _prefix_cache(tokenizer, model)
+    with profiler.span("tokenize", batch=len(prompts)):
+        inputs = _prefixed_inputs(prompts, tokenizer, model) if reuse_prefix else None
+        if inputs is None:
+            inputs = _tokenize(tokenizer, prompts, return_tensors="pt", padding=True).to(model.device)
+
+    input_length = inputs['input_ids'].shape[1]
+    stopping = None
+    if max_sentences or stop_on_newline:
+        stopping = StoppingCriteriaList([
+            AnswerStoppingCriteria(tokenizer, input_length, max_sentences, stop_on_newline)
+        ])
+    sampling = {"do_sample": False} if greedy else {"temperature": 0.2, "do_sample": True}
+
+    timer = _StageTimer() if profiler.enabled else None
+    with torch.no_grad():
         output_ids = model.generate(
             **inputs,
-            max_new_tokens=100,      
-            temperature=0.2,          
-            do_sample=True,           
-            pad_token_id=tokenizer.eos_token_id
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id,
+            streamer=timer,
+            assistant_model=assistant_model,
+            stopping_criteria=stopping,
+            **sampling
         )
-    
-    
-    input_length = inputs['input_ids'].shape[1]
-    generated_tokens = output_ids[0][input_length:]
-    
-    answer = tokenizer.decode(generated_tokens, skip_special_tokens=True)
-    
 
-    print("Answer:")
-    print(answer.strip())
-    
-    return answer.strip()
+    if timer is not None:
+        timer.record(len(prompts))
+        profiler.count("prompt_tokens", int(inputs['attention_mask'].sum()))
+        profiler.count("output_tokens", int((output_ids[:, input_length:] != tokenizer.pad_token_id).sum()))
+        profiler.count("generate_batches")
+    answers = tokenizer.batch_decode(output_ids[:, input_length:], skip_special_tokens=True)
+    return [_trim_answer(answer, max_sentences, stop_on_newline) for answer in answers]
+
+
+def _length_buckets(prompts, tokenizer, batch_size):
+    lengths = [len(ids) for ids in _tokenize(tokenizer, prompts)['input_ids']]
+    order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def generate_answers(items, retriever, tokenizer, model, batch_size=8, reuse_prefix=True,
+                     max_context_tokens=MAX_CONTEXT_TOKENS, **decoding):
+    # items is a list of (qid, query) pairs; yields (qid, answer) pairs as
+    # each length bucket finishes, so the order differs from the input.
+    # decoding is passed through to _generate_batch.
+    items = list(items)
+    if not items:
+        return
+    batch_size, reuse_prefix = _decoding_batch_size(batch_size, reuse_prefix, decoding)
+
+    prompts = [_retrieve_prompt(query, retriever, tokenizer, max_context_tokens) for _, query in items]
+
+    _prepare_batch_tokenizer(tokenizer)
+    for bucket in _length_buckets(prompts, tokenizer, batch_size):
+        answers = _generate_batch([prompts[i] for i in bucket], tokenizer, model, reuse_prefix=reuse_prefix, **decoding)
+        for i, answer in zip(bucket, answers):
+            yield items[i][0], answer
+
+
+_PIPELINE_DONE = object()
+
+
+def _fill_prompt_queue(items, retriever, tokenizer, max_context_tokens, prompt_queue, stop, retrieval_workers):
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=retrieval_workers) as executor:
+            # Submit lazily so at most `retrieval_workers` searches run ahead
+            # of what the bounded queue can accept.
+            pending = []
+            for qid, query in items:
+                pending.append((qid, executor.submit(_retrieve_prompt, query, retriever, tokenizer, max_context_tokens)))
+                if len(pending) >= retrieval_workers:
+                    qid, future = pending.pop(0)
+                    prompt_queue.put((qid, future.result()))
+                if stop.is_set():
+                    return
+            for qid, future in pending:
+                prompt_queue.put((qid, future.result()))
+    except Exception as e:
+        prompt_queue.put(e)
+    finally:
+        prompt_queue.put(_PIPELINE_DONE)
+
+
+def generate_answers_pipelined(items, retriever, tokenizer, model, batch_size=8, prefetch=16, retrieval_workers=2,
+                               reuse_prefix=True, max_context_tokens=MAX_CONTEXT_TOKENS, **decoding):
+    # Same contract as generate_answers, but retrieval and prompt building run
+    # in a background thread pool that keeps up to `prefetch` prompts queued
+    # while the model decodes the current batch.
+    items = list(items)
+    if not items:
+        return
+    batch_size, reuse_prefix = _decoding_batch_size(batch_size, reuse_prefix, decoding)
+
+    prompt_queue = queue.Queue(maxsize=max(prefetch, batch_size))
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_fill_prompt_queue,
+        args=(items, retriever, tokenizer, max_context_tokens, prompt_queue, stop, retrieval_workers),
+        daemon=True,
+    )
+    producer.start()
+
+    _prepare_batch_tokenizer(tokenizer)
+    finished = False
+    try:
+        while not finished:
+            batch = []
+            while len(batch) < batch_size:
+                entry = prompt_queue.get()
+                if entry is _PIPELINE_DONE:
+                    finished = True
+                    break
+                if isinstance(entry, Exception):
+                    raise entry
+                batch.append(entry)
+            if not batch:
+                break
+            answers = _generate_batch([prompt for _, prompt in batch], tokenizer, model, reuse_prefix=reuse_prefix,
+                                      **decoding)
+            for (qid, _), answer in zip(batch, answers):
+                yield qid, answer
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue.
+        while producer.is_alive():
+            try:
+                prompt_queue.get_nowait()
+            except queue.Empty:
+                producer.join(timeout=0.1)
 
 
 if __name__ == "__main__":
-    retriever = CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2')
+    # Imported here so the generation functions work with any retriever
+    # (bench_suite.py, bench_serve.py) without process.py's dependencies.
+    from process import CustomHybridRetriever
+
+    retriever = CachedRetriever(
+        CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2'),
+        cache_path="output/retrieval_cache.pkl"
+    )
     retriever.load_index("rag_index")
     
    
@@ -85,6 +490,7 @@ if __name__ == "__main__":
     while True:
         user_query = input("\nEnter your question (or 'quit'): ")
         if user_query.lower() in ['quit', 'exit']:
+            retriever.save()
             break
         if not user_query.strip():
             continue
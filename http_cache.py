@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "output/http_cache"
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def normalize_url(url: str) -> str:
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    port = parsed.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, parsed.path or "/", "", query, ""))
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class HTTPCache:
+    # On-disk cache of fetched pages. Entries are small JSON files keyed by
+    # the hash of the normalized URL; bodies are stored once per content
+    # hash, so identical pages under different URLs share storage. Entry
+    # mtimes double as last-access times: they seed an in-memory LRU index
+    # of entries and body sizes at startup, which puts and hits then keep
+    # current, so size-based eviction never rescans the directory.
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        # entry path -> (body digest, body size), least recently used first.
+        self._entries = OrderedDict()
+        # Entries per body, bytes of referenced bodies, and bodies being
+        # written by a put that has not registered its entry yet.
+        self._body_refs = Counter()
+        self._bytes = 0
+        self._pending = Counter()
+        os.makedirs(os.path.join(cache_dir, "entries"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "bodies"), exist_ok=True)
+        self._load_index()
+
+    def _entry_path(self, url: str) -> str:
+        key = _sha256(normalize_url(url).encode("utf-8"))
+        return os.path.join(self.cache_dir, "entries", key[:2], key + ".json")
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "bodies", digest[:2], digest + ".html")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _load_index(self):
+        loaded = []
+        for root, _, files in os.walk(os.path.join(self.cache_dir, "entries")):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                    loaded.append((os.path.getmtime(path), path, entry["body"], entry["size"]))
+                except (OSError, ValueError, KeyError):
+                    continue
+        for _, path, digest, size in sorted(loaded):
+            self._add(path, digest, size)
+
+        # Bodies left behind by entries removed in an earlier run.
+        for root, _, files in os.walk(os.path.join(self.cache_dir, "bodies")):
+            for name in files:
+                if name.endswith(".html") and name[:-len(".html")] not in self._body_refs:
+                    os.remove(os.path.join(root, name))
+        self.evict()
+
+    # The index helpers below are called with self._lock held (or before
+    # the cache is shared).
+
+    def _add(self, path: str, digest: str, size: int):
+        self._remove(path)
+        self._entries[path] = (digest, size)
+        if self._body_refs[digest] == 0:
+            self._bytes += size
+        self._body_refs[digest] += 1
+
+    def _remove(self, path: str):
+        if path not in self._entries:
+            return
+        digest, size = self._entries.pop(path)
+        self._body_refs[digest] -= 1
+        if self._body_refs[digest] == 0:
+            del self._body_refs[digest]
+            self._bytes -= size
+            if not self._pending[digest]:
+                try:
+                    os.remove(self._body_path(digest))
+                except OSError:
+                    pass
+
+    def get(self, url: str) -> Dict:
+        entry_path = self._entry_path(url)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            with open(self._body_path(entry["body"]), "r", encoding="utf-8") as f:
+                entry["html"] = f.read()
+            os.utime(entry_path)
+            with self._lock:
+                if entry_path in self._entries:
+                    self._entries.move_to_end(entry_path)
+            return entry
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def conditional_headers(self, entry: Dict) -> Dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, html: str, headers: Dict = None, mode: str = "http"):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        body = html.encode("utf-8")
+        digest = _sha256(body)
+        body_path = self._body_path(digest)
+        # Marked pending first, so dropping another entry on the same body
+        # cannot delete it between this write and the entry's registration.
+        with self._lock:
+            self._pending[digest] += 1
+        try:
+            if not os.path.exists(body_path):
+                self._write_atomic(body_path, body)
+            self._put_entry(url, digest, len(body), headers, mode)
+        finally:
+            with self._lock:
+                self._pending[digest] -= 1
+                if not self._pending[digest]:
+                    del self._pending[digest]
+        self.evict()
+
+    def _put_entry(self, url: str, digest: str, size: int, headers: Dict, mode: str):
+        entry_path = self._entry_path(url)
+        entry = {
+            "url": normalize_url(url),
+            "body": digest,
+            "size": size,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time(),
+            "mode": mode,
+        }
+        # Written under the lock so eviction cannot delete the new file on
+        # behalf of the entry it replaces.
+        with self._lock:
+            self._write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+            self._add(entry_path, digest, size)
+
+    def touch(self, url: str, headers: Dict = None):
+        # A 304 revalidation: the stored body is current again.
+        entry_path = self._entry_path(url)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        entry["fetched_at"] = time.time()
+        entry["etag"] = headers.get("etag") or entry.get("etag")
+        entry["last_modified"] = headers.get("last-modified") or entry.get("last_modified")
+        with self._lock:
+            if entry_path not in self._entries:
+                return
+            self._write_atomic(entry_path, json.dumps(entry).encode("utf-8"))
+            self._entries.move_to_end(entry_path)
+
+    def evict(self):
+        # Drop least recently used entries until the bodies still referenced
+        # fit in max_bytes; a body goes with the last entry using it.
+        with self._lock:
+            removed = 0
+            while self._entries and self._bytes > self.max_bytes:
+                path = next(iter(self._entries))
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                self._remove(path)
+                removed += 1
+            if removed:
+                logger.info(f"HTTP cache: evicted {removed} entries, {self._bytes} bytes in use")
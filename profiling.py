@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import Counter, defaultdict
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list; None when empty.
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Profiler:
+    # Wall-clock spans and counters, off by default. While disabled, span()
+    # returns a shared no-op context manager and record()/count() return
+    # immediately, so instrumented code pays one attribute check per call.
+    # Spans given a group are also aggregated under "name[group]" (e.g. per
+    # domain); every span keeps its args in the trace timeline.
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._durations = defaultdict(list)
+        self._counters = Counter()
+        self._events = []
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self._origin = time.perf_counter()
+            self._durations.clear()
+            self._counters.clear()
+            self._events.clear()
+
+    def span(self, name: str, group: str = None, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, group, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, group, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter() - start, group, **args)
+
+    def record(self, name: str, start: float, duration: float, group: str = None, **args):
+        # start is a time.perf_counter() value.
+        if not self.enabled:
+            return
+        with self._lock:
+            self._durations[name].append(duration)
+            if group is not None:
+                self._durations[f"{name}[{group}]"].append(duration)
+                args["group"] = group
+            self._events.append((name, start, duration, threading.get_ident(), args))
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += value
+
+    def summary(self) -> dict:
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self._durations.items()}
+            counters = dict(self._counters)
+        spans = {}
+        for name, values in sorted(durations.items()):
+            spans[name] = {
+                "count": len(values),
+                "total_s": round(sum(values), 4),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            }
+        return {"spans": spans, "counters": counters}
+
+    def format_summary(self, grouped: bool = False) -> str:
+        summary = self.summary()
+        lines = [f"{'stage':<40} {'count':>7} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for name, s in summary["spans"].items():
+            if "[" in name and not grouped:
+                continue
+            lines.append(f"{name[:40]:<40} {s['count']:>7} {s['total_s']:>9.2f} "
+                         f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+        for name, value in sorted(summary["counters"].items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+    def write_summary(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_trace(self, path: str):
+        # Chrome trace event format; open in chrome://tracing or Perfetto.
+        with self._lock:
+            events = list(self._events)
+            counters = dict(self._counters)
+        pid = os.getpid()
+        trace = [
+            {
+                "name": name, "ph": "X", "pid": pid, "tid": tid,
+                "ts": round((start - self._origin) * 1e6, 1), "dur": round(duration * 1e6, 1),
+                "args": args,
+            }
+            for name, start, duration, tid, args in events
+        ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms", "otherData": {"counters": counters}}, f)
+
+
+# Shared by generate.py, webscraper.py and the entry points.
+profiler = Profiler()
@@ -0,0 +1,121 @@
+import os
+import re
+import pickle
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def normalize_query(query: str) -> str:
+    # Case, punctuation and whitespace differences map to the same key.
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def index_version(path: str) -> str:
+    # Fingerprint of the files under an index path; changes whenever the
+    # index is rebuilt or a different one is loaded.
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8"))
+    if os.path.isdir(path):
+        entries = []
+        for root, _, files in os.walk(path):
+            for name in files:
+                full = os.path.join(root, name)
+                entries.append(full)
+    else:
+        entries = [path] if os.path.exists(path) else []
+    for full in sorted(entries):
+        stat = os.stat(full)
+        digest.update(f"{os.path.relpath(full, path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CachedRetriever:
+    # Drop-in wrapper around CustomHybridRetriever that memoizes search()
+    # results in a bounded LRU keyed by (normalized query, top_k, rrf_k,
+    # index version). A hit skips both the MiniLM query encoding and the
+    # BM25/dense search. Other attributes are forwarded to the wrapped
+    # retriever.
+
+    def __init__(self, retriever, max_size: int = DEFAULT_CACHE_SIZE, cache_path: str = None):
+        self.retriever = retriever
+        self.max_size = max_size
+        self.cache_path = cache_path
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            self._load(cache_path)
+
+    def __getattr__(self, name):
+        return getattr(self.retriever, name)
+
+    def load_index(self, path, *args, **kwargs):
+        result = self.retriever.load_index(path, *args, **kwargs)
+        version = index_version(path)
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                # Persisted entries from other index versions can never hit.
+                for key in [key for key in self._entries if key[3] != version]:
+                    del self._entries[key]
+        return result
+
+    def search(self, query, top_k=5, rrf_k=60):
+        key = (normalize_query(query), top_k, rrf_k, self.version)
+        with self._lock:
+            results = self._entries.get(key)
+            if results is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(results)
+            self.misses += 1
+
+        results = self.retriever.search(query, top_k=top_k, rrf_k=rrf_k)
+        with self._lock:
+            self._entries[key] = list(results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return results
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path: str = None):
+        path = path or self.cache_path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            entries = list(self._entries.items())
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"Warning: could not load retrieval cache {path}: {e}")
+            return
+        for key, results in entries[-self.max_size:]:
+            self._entries[key] = results
@@ -1,15 +1,61 @@
 import json
+import argparse
 import torch
-from generate import build_prompt, generate_answer
+from generate import generate_answers, generate_answers_pipelined, MAX_CONTEXT_TOKENS
+from checkpoint import load_checkpoint, open_checkpoint, append_checkpoint, write_answers
 from process import CustomHybridRetriever
+from retrieval_cache import CachedRetriever, DEFAULT_CACHE_SIZE
+from profiling import profiler
 from transformers import AutoTokenizer, AutoModelForCausalLM
 ANDREW_ID = "justinl5"
 INPUT_FILE = "leaderboard_queries.json"
 OUTPUT_FILE = "output/leaderboard_answers.json"
 MODEL_ID = "mistralai/Mistral-7B-Instruct-v0.3"
+CHECKPOINT_FILE = "output/leaderboard_answers.checkpoint.jsonl"
+RETRIEVAL_CACHE_FILE = "output/retrieval_cache.pkl"
+PROFILE_FILE = "output/leaderboard_profile.json"
+BATCH_SIZE = 8
+PREFETCH = 16
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--resume", action="store_true",
+                        help=f"skip ids already answered in {CHECKPOINT_FILE}")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="overlap retrieval with generation using a background retrieval pool")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH,
+                        help="max prompts retrieved ahead of generation in --pipeline mode")
+    parser.add_argument("--retrieval-workers", type=int, default=2)
+    parser.add_argument("--no-prefix-cache", action="store_true",
+                        help="prefill the full prompt instead of reusing the cached instruction prefix")
+    parser.add_argument("--max-context-tokens", type=int, default=MAX_CONTEXT_TOKENS,
+                        help="token budget for the retrieved chunks in each prompt")
+    parser.add_argument("--retrieval-cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    parser.add_argument("--assistant-model", metavar="MODEL_ID",
+                        help="small draft model sharing the tokenizer (e.g. meta-llama/Llama-3.2-1B-Instruct for "
+                             "Llama-3.2-3B) for speculative decoding; answers one query at a time")
+    parser.add_argument("--greedy", action="store_true",
+                        help="greedy decoding instead of temperature-0.2 sampling")
+    parser.add_argument("--max-sentences", type=int,
+                        help="stop each answer once it has this many complete sentences")
+    parser.add_argument("--stop-on-newline", action="store_true",
+                        help="stop each answer at its first newline")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"time each pipeline stage and write p50/p95/p99 summaries to {PROFILE_FILE}")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="also write a Chrome-trace JSON timeline of every stage to PATH")
+    return parser.parse_args()
 
 def main():
-    retriever = CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2')
+    args = parse_args()
+    if args.profile or args.trace:
+        profiler.enable()
+
+    retriever = CachedRetriever(
+        CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2'),
+        max_size=args.retrieval_cache_size, cache_path=RETRIEVAL_CACHE_FILE
+    )
     retriever.load_index("rag_index")
     
     model_id = "mistralai/Mistral-7B-Instruct-v0.3" 
@@ -22,21 +68,52 @@ def main():
         torch_dtype=torch.bfloat16,
         trust_remote_code=True
     )
+    decoding = {"greedy": args.greedy, "max_sentences": args.max_sentences, "stop_on_newline": args.stop_on_newline}
+    if args.assistant_model:
+        decoding["assistant_model"] = AutoModelForCausalLM.from_pretrained(
+            args.assistant_model,
+            device_map="auto",
+            torch_dtype=torch.bfloat16,
+            trust_remote_code=True
+        )
     with open(INPUT_FILE, "r") as f:
         queries = json.load(f)
 
     print(f"Loaded {len(queries)} queries from {INPUT_FILE}")
 
-    results = {"andrewid": ANDREW_ID}
+    items = [(item["id"], item["question"]) for item in queries]
+    done = load_checkpoint(CHECKPOINT_FILE) if args.resume else {}
+    pending = [(qid, question) for qid, question in items if qid not in done]
+    if done:
+        print(f"Resuming: {len(done)} answers already in {CHECKPOINT_FILE}, {len(pending)} remaining")
+
+    if args.pipeline:
+        answer_stream = generate_answers_pipelined(
+            pending, retriever, tokenizer, model, batch_size=args.batch_size,
+            prefetch=args.prefetch, retrieval_workers=args.retrieval_workers,
+            reuse_prefix=not args.no_prefix_cache, max_context_tokens=args.max_context_tokens, **decoding
+        )
+    else:
+        answer_stream = generate_answers(
+            pending, retriever, tokenizer, model, batch_size=args.batch_size,
+            reuse_prefix=not args.no_prefix_cache, max_context_tokens=args.max_context_tokens, **decoding
+        )
+
+    with open_checkpoint(CHECKPOINT_FILE, resume=args.resume) as checkpoint:
+        for i, (qid, answer) in enumerate(answer_stream):
+            print(f"\n[{len(done)+i+1}/{len(queries)}] Answered query {qid}: {answer}")
+            append_checkpoint(checkpoint, qid, answer)
+
+    retriever.save()
+    print(f"Retrieval cache: {retriever.stats()}")
+    if profiler.enabled:
+        print(profiler.format_summary())
+        profiler.write_summary(PROFILE_FILE)
+        if args.trace:
+            profiler.write_trace(args.trace)
 
-    for i, item in enumerate(queries):
-        qid = item["id"]
-        question = item["question"]
-        print(f"\n[{i+1}/{len(queries)}] Processing query {qid}: {question}")
-        answer = generate_answer(question, retriever, tokenizer, model)
-        results[qid] = answer
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(results, f, indent=2)
+    # Buckets finish out of order; the final file follows query order.
+    write_answers(CHECKPOINT_FILE, OUTPUT_FILE, ANDREW_ID, [qid for qid, _ in items])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,254 @@
+import json
+import time
+import queue
+import argparse
+import threading
+import concurrent.futures
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from generate import generate_answers, MAX_CONTEXT_TOKENS
+from retrieval_cache import CachedRetriever, DEFAULT_CACHE_SIZE
+from profiling import percentile
+
+MODEL_ID = "meta-llama/Llama-3.2-3B-Instruct"
+INDEX_PATH = "rag_index"
+RETRIEVAL_CACHE_FILE = "output/retrieval_cache.pkl"
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 20
+MAX_QUEUE = 64
+REQUEST_TIMEOUT = 300
+LATENCY_WINDOW = 1000
+
+
+class MicroBatcher:
+    # Single worker thread that owns the retriever and the model. Requests
+    # wait in a bounded queue; the worker takes the first one, keeps
+    # collecting until the batch is full or max_wait_ms has passed since it
+    # arrived, and answers the whole batch with one generate_answers call.
+    def __init__(self, retriever, tokenizer, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_queue=MAX_QUEUE, reuse_prefix=True, max_context_tokens=MAX_CONTEXT_TOKENS):
+        self.retriever = retriever
+        self.tokenizer = tokenizer
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.reuse_prefix = reuse_prefix
+        self.max_context_tokens = max_context_tokens
+        self.requests = queue.Queue(maxsize=max_queue)
+        self.started_at = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "rejected": 0, "errors": 0, "batches": 0, "batched_requests": 0}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, question):
+        # Returns a Future resolving to the answer; raises queue.Full when
+        # the queue is at capacity so the caller can shed load.
+        future = concurrent.futures.Future()
+        try:
+            self.requests.put_nowait((question, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._counts["rejected"] += 1
+            raise
+        with self._lock:
+            self._counts["requests"] += 1
+        return future
+
+    def _collect(self):
+        try:
+            batch = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [(i, question) for i, (question, _, _) in enumerate(batch)]
+            try:
+                answers = dict(generate_answers(
+                    items, self.retriever, self.tokenizer, self.model, batch_size=len(items),
+                    reuse_prefix=self.reuse_prefix, max_context_tokens=self.max_context_tokens
+                ))
+            except Exception as e:
+                with self._lock:
+                    self._counts["errors"] += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            with self._lock:
+                self._counts["batches"] += 1
+                self._counts["batched_requests"] += len(batch)
+                self._latencies.extend(now - submitted for _, _, submitted in batch)
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(answers[i])
+
+    def metrics(self):
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = sorted(self._latencies)
+        return {
+            **counts,
+            "queue_depth": self.requests.qsize(),
+            "queue_capacity": self.requests.maxsize,
+            "mean_batch_size": counts["batched_requests"] / counts["batches"] if counts["batches"] else 0.0,
+            "latency_p50_ms": None if not latencies else round(percentile(latencies, 0.50) * 1000, 1),
+            "latency_p95_ms": None if not latencies else round(percentile(latencies, 0.95) * 1000, 1),
+            "latency_p99_ms": None if not latencies else round(percentile(latencies, 0.99) * 1000, 1),
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    # POST /ask {"question": "..."} -> {"answer": "...", "latency_ms": ...}
+    # GET /health, GET /metrics
+    batcher = None
+    request_timeout = REQUEST_TIMEOUT
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            alive = self.batcher.is_alive()
+            self._send_json(200 if alive else 503, {"status": "ok" if alive else "batcher stopped",
+                                                    "queue_depth": self.batcher.requests.qsize()})
+        elif self.path == "/metrics":
+            self._send_json(200, self.batcher.metrics())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/ask":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            question = json.loads(self.rfile.read(length) or b"{}").get("question")
+        except (ValueError, AttributeError):
+            question = None
+        if not isinstance(question, str) or not question.strip():
+            self._send_json(400, {"error": "expected a JSON body with a non-empty \"question\""})
+            return
+
+        start = time.perf_counter()
+        try:
+            future = self.batcher.submit(question)
+        except queue.Full:
+            self._send_json(503, {"error": "server busy, queue full"}, {"Retry-After": "1"})
+            return
+        try:
+            answer = future.result(timeout=self.request_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._send_json(504, {"error": "timed out waiting for an answer"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, {"answer": answer, "latency_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(batcher, host="127.0.0.1", port=8000, request_timeout=REQUEST_TIMEOUT):
+    handler = type("Handler", (RAGRequestHandler,), {"batcher": batcher, "request_timeout": request_timeout})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_ID,
+                        help="HF model id; a tiny causal LM (e.g. sshleifer/tiny-gpt2) works on CPU")
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                        help="how long the first request of a batch waits for others to join it")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE,
+                        help="requests waiting beyond this are rejected with 503")
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--no-prefix-cache", action="store_true",
+                        help="prefill the full prompt instead of reusing the cached instruction prefix")
+    parser.add_argument("--max-context-tokens", type=int, default=MAX_CONTEXT_TOKENS,
+                        help="token budget for the retrieved chunks in each prompt")
+    parser.add_argument("--retrieval-cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    return parser.parse_args()
+
+
+def main():
+    # Imported here so bench_serve.py can drive the server with a stub.
+    from process import CustomHybridRetriever
+
+    args = parse_args()
+
+    retriever = CachedRetriever(
+        CustomHybridRetriever(dense_model_name='all-MiniLM-L6-v2'),
+        max_size=args.retrieval_cache_size, cache_path=RETRIEVAL_CACHE_FILE
+    )
+    retriever.load_index(args.index)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model,
+        device_map="auto",
+        torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
+        trust_remote_code=True
+    )
+
+    batcher = MicroBatcher(
+        retriever, tokenizer, model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue, reuse_prefix=not args.no_prefix_cache, max_context_tokens=args.max_context_tokens
+    ).start()
+    server = create_server(batcher, args.host, args.port, args.request_timeout)
+    print(f"Serving {args.model} on http://{args.host}:{args.port} (POST /ask, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        retriever.save()
+        print(f"Retrieval cache: {retriever.stats()}")
+
+if __name__ == "__main__":
+    main()
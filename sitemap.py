@@ -0,0 +1,98 @@
+import gzip
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+logger = logging.getLogger(__name__)
+
+MAX_SITEMAPS = 50
+SITEMAP_TIMEOUT = 15
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    # W3C datetime: a date, or a date-time with an optional zone; naive
+    # values are taken as UTC.
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def parse_sitemap(content: bytes) -> Tuple[str, List[Tuple[str, Optional[datetime]]]]:
+    # Returns ("index", [(child sitemap, lastmod)]) for a sitemap index or
+    # ("urlset", [(page url, lastmod)]) for a regular sitemap.
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    root = ET.fromstring(content)
+    kind = "index" if _local_name(root.tag) == "sitemapindex" else "urlset"
+    entries = []
+    for node in root:
+        loc = lastmod = None
+        for child in node:
+            name = _local_name(child.tag)
+            if name == "loc" and child.text:
+                loc = child.text.strip()
+            elif name == "lastmod":
+                lastmod = parse_lastmod(child.text)
+        if loc:
+            entries.append((loc, lastmod))
+    return kind, entries
+
+
+def robots_sitemaps(session, base_url: str) -> List[str]:
+    # Sitemap URLs declared in robots.txt, or the conventional /sitemap.xml.
+    robots_url = urljoin(base_url, "/robots.txt")
+    sitemaps = []
+    try:
+        response = session.get(robots_url, timeout=SITEMAP_TIMEOUT)
+        if response.ok:
+            for line in response.text.splitlines():
+                key, _, value = line.partition(":")
+                if key.strip().lower() == "sitemap" and value.strip():
+                    sitemaps.append(urljoin(base_url, value.strip()))
+    except Exception as e:
+        logger.debug(f"Could not read {robots_url}: {e}")
+    return sitemaps or [urljoin(base_url, "/sitemap.xml")]
+
+
+def discover_from_sitemaps(session, base_url: str, max_sitemaps: int = MAX_SITEMAPS):
+    # Walks robots.txt sitemaps and nested sitemap indexes over plain HTTP.
+    # Returns [(url, lastmod)] or None when the site has no usable sitemap.
+    queue = robots_sitemaps(session, base_url)
+    seen = set()
+    pages = {}
+    found = False
+    while queue and len(seen) < max_sitemaps:
+        sitemap_url = queue.pop(0)
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        try:
+            response = session.get(sitemap_url, timeout=SITEMAP_TIMEOUT)
+            if not response.ok:
+                continue
+            kind, entries = parse_sitemap(response.content)
+        except Exception as e:
+            logger.debug(f"Could not read sitemap {sitemap_url}: {e}")
+            continue
+        found = True
+        if kind == "index":
+            # Children modified most recently first, so the cap keeps them.
+            entries.sort(key=lambda e: e[1] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+            queue.extend(loc for loc, _ in entries if urlparse(loc).scheme in ("http", "https"))
+        else:
+            for loc, lastmod in entries:
+                pages[loc] = lastmod
+    if not found or not pages:
+        return None
+    logger.info(f"Sitemaps for {urlparse(base_url).netloc}: {len(pages)} URLs from {len(seen)} sitemap files")
+    return list(pages.items())
@@ -1,13 +1,29 @@
 import os
+import re
 import json
+import argparse
 import time
+import heapq
+import asyncio
 import logging
+import itertools
 import threading
+import multiprocessing
 import concurrent.futures
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 from typing import Dict, List
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError
+from playwright.async_api import async_playwright
+from http_cache import HTTPCache, DEFAULT_CACHE_DIR
+from doc_store import DocumentStore, convert_json_to_jsonl
+from dedup import NearDuplicateIndex
+from sitemap import discover_from_sitemaps
+from profiling import profiler
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -106,33 +122,294 @@ visited_urls = set()
 visited_lock = threading.Lock()
 thread_local = threading.local()
 
+# Rendering only needs the final DOM text, so everything except the
+# document and the scripts/requests that build it is blocked by default.
+RENDER_ALLOWED_RESOURCE_TYPES = {"document", "script", "xhr", "fetch"}
+BLOCKED_TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net",
+    "hotjar.com", "segment.io", "scorecardresearch.com", "adservice.google.com",
+)
+DEFAULT_WAIT_UNTIL = "domcontentloaded"
+# Per-domain Playwright wait strategy for pages that fill in content after
+# DOMContentLoaded, e.g. {"events.cmu.edu": "networkidle"}.
+DOMAIN_WAIT_UNTIL = {}
+block_resources = True
+reuse_pages = True
+
+def should_block_request(resource_type: str, url: str) -> bool:
+    if resource_type not in RENDER_ALLOWED_RESOURCE_TYPES:
+        return True
+    host = urlparse(url).netloc
+    return any(host == tracker or host.endswith("." + tracker) for tracker in BLOCKED_TRACKER_HOSTS)
+
+def wait_strategy(url: str) -> str:
+    host = urlparse(url).netloc
+    while host:
+        if host in DOMAIN_WAIT_UNTIL:
+            return DOMAIN_WAIT_UNTIL[host]
+        host = host.partition(".")[2]
+    return DEFAULT_WAIT_UNTIL
+
+def _route_request(route):
+    if should_block_request(route.request.resource_type, route.request.url):
+        route.abort()
+    else:
+        route.continue_()
+
+async def _route_request_async(route):
+    if should_block_request(route.request.resource_type, route.request.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
 def get_playwright_context():
     if not hasattr(thread_local, "playwright"):
         thread_local.playwright = sync_playwright().start()
         thread_local.browser = thread_local.playwright.chromium.launch(headless=True)
         thread_local.context = thread_local.browser.new_context()
+        if block_resources:
+            thread_local.context.route("**/*", _route_request)
+        thread_local.page_pool = []
     return thread_local.context
 
-def fetch_html(url: str) -> str:
+def close_playwright_context():
+    if hasattr(thread_local, "playwright"):
+        thread_local.browser.close()
+        thread_local.playwright.stop()
+        for name in ("playwright", "browser", "context", "page_pool"):
+            delattr(thread_local, name)
+
+def _acquire_page():
     context = get_playwright_context()
-    page = context.new_page()
+    if thread_local.page_pool:
+        return thread_local.page_pool.pop()
+    return context.new_page()
+
+def _release_page(page, healthy: bool):
+    # Healthy pages go back to the pool; a page that errored is discarded
+    # in case it is left mid-navigation.
+    if reuse_pages and healthy and not page.is_closed():
+        thread_local.page_pool.append(page)
+    else:
+        page.close()
+
+def render_html(url: str) -> tuple:
+    page = _acquire_page()
+    healthy = False
     try:
-        response = page.goto(url, timeout=15000, wait_until="domcontentloaded")
+        response = page.goto(url, timeout=15000, wait_until=wait_strategy(url))
+        healthy = True
         if response and not response.ok:
             logger.warning(f"HTTP Error {response.status} for {url}")
-            return ""
-        return page.content()
+            return "", {}
+        return page.content(), (response.headers if response else {})
     except PlaywrightTimeoutError:
         logger.warning(f"Timeout exploring {url}")
-        return ""
+        return "", {}
     except PlaywrightError as e:
         logger.warning(f"Playwright error exploring {url}: {e}")
-        return ""
+        return "", {}
     except Exception as e:
         logger.warning(f"Unexpected error exploring {url}: {e}")
-        return ""
+        return "", {}
     finally:
-        page.close()
+        _release_page(page, healthy)
+
+class AsyncPagePool:
+    # Reusable pages on one browser context for the asyncio engine. Chromium
+    # is launched on the first render, so a crawl served entirely over HTTP
+    # never starts a browser.
+    def __init__(self, playwright):
+        self.playwright = playwright
+        self.browser = None
+        self.context = None
+        self._idle = []
+        self._launch_lock = asyncio.Lock()
+
+    async def _get_context(self):
+        async with self._launch_lock:
+            if self.context is None:
+                self.browser = await self.playwright.chromium.launch(headless=True)
+                context = await self.browser.new_context()
+                if block_resources:
+                    await context.route("**/*", _route_request_async)
+                self.context = context
+        return self.context
+
+    async def acquire(self):
+        if self._idle:
+            return self._idle.pop()
+        return await (await self._get_context()).new_page()
+
+    async def release(self, page, healthy: bool):
+        if reuse_pages and healthy and not page.is_closed():
+            self._idle.append(page)
+        else:
+            await page.close()
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+
+async def render_html_async(pages: AsyncPagePool, url: str) -> tuple:
+    page = await pages.acquire()
+    healthy = False
+    try:
+        response = await page.goto(url, timeout=15000, wait_until=wait_strategy(url))
+        healthy = True
+        if response and not response.ok:
+            logger.warning(f"HTTP Error {response.status} for {url}")
+            return "", {}
+        return await page.content(), (response.headers if response else {})
+    except PlaywrightTimeoutError:
+        logger.warning(f"Timeout exploring {url}")
+        return "", {}
+    except PlaywrightError as e:
+        logger.warning(f"Playwright error exploring {url}: {e}")
+        return "", {}
+    except Exception as e:
+        logger.warning(f"Unexpected error exploring {url}: {e}")
+        return "", {}
+    finally:
+        await pages.release(page, healthy)
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+}
+HTTP_POOL_SIZE = 32
+# After this many plain-HTTP misses with no successes, a domain is rendered
+# in the browser directly for the rest of the crawl.
+NEEDS_BROWSER_AFTER = 2
+# Statuses a browser would get too (plus every 5xx): no render fallback.
+GONE_STATUSES = {404, 410}
+
+needs_browser_domains = set()
+fetch_stats = defaultdict(Counter)
+fetch_stats_lock = threading.Lock()
+
+_SCRIPT_STYLE_RE = re.compile(r"<(script|style|noscript)[^>]*>.*?</\1\s*>", re.S | re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+def get_http_session() -> requests.Session:
+    if not hasattr(thread_local, "http_session"):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(HTTP_HEADERS)
+        thread_local.http_session = session
+    return thread_local.http_session
+
+def looks_like_js_shell(html: str) -> bool:
+    # Cheap check on the raw response, without a full parse.
+    text = _TAG_RE.sub(" ", _SCRIPT_STYLE_RE.sub(" ", html))
+    text = " ".join(text.split())
+    if len(text) < MIN_TEXT_LENGTH:
+        return True
+    text_lower = text.lower()
+    return any(kw in text_lower for kw in USELESS_BODY_KEYWORDS)
+
+def _record_fetch(url: str, mode: str):
+    domain = urlparse(url).netloc
+    with fetch_stats_lock:
+        stats = fetch_stats[domain]
+        stats[mode] += 1
+        if mode == "http_fallback" and stats["http"] == 0 and stats["http_fallback"] >= NEEDS_BROWSER_AFTER:
+            if domain not in needs_browser_domains:
+                logger.info(f"Marking {domain} as needs-browser")
+            needs_browser_domains.add(domain)
+
+# Set to an HTTPCache to serve and revalidate fetches from disk.
+http_cache = None
+
+def fetch_html_http(url: str) -> tuple:
+    # Cache lookup plus plain keep-alive HTTP fetch. Returns (html,
+    # needs_render); needs_render is True when the page should be rendered
+    # in the browser instead: connection errors, non-HTML responses, JS
+    # shells, domains already learned to need a browser, and changed
+    # browser-rendered pages. Missing pages and server errors are not
+    # retried in the browser and do not count toward needs-browser.
+    cached = http_cache.get(url) if http_cache else None
+    if cached and (http_cache.offline or http_cache.is_fresh(cached)):
+        _record_fetch(url, "cache")
+        return cached["html"], False
+    if http_cache and http_cache.offline:
+        _record_fetch(url, "offline_miss")
+        return "", False
+
+    domain = urlparse(url).netloc
+    if domain in needs_browser_domains and not cached:
+        return "", True
+    try:
+        headers = http_cache.conditional_headers(cached) if cached else {}
+        response = get_http_session().get(url, headers=headers, timeout=15)
+        if cached and response.status_code == 304:
+            http_cache.touch(url, response.headers)
+            _record_fetch(url, "revalidated")
+            return cached["html"], False
+        if response.status_code in GONE_STATUSES or response.status_code >= 500:
+            if cached and response.status_code >= 500:
+                logger.warning(f"Revalidation got HTTP {response.status_code} for {url}, serving stale copy")
+                _record_fetch(url, "cache")
+                return cached["html"], False
+            logger.debug(f"HTTP {response.status_code} for {url}")
+            _record_fetch(url, "http_error")
+            return "", False
+        if cached and (cached["mode"] == "browser" or domain in needs_browser_domains):
+            return "", True
+        content_type = response.headers.get("Content-Type", "")
+        if response.ok and "html" in content_type and not looks_like_js_shell(response.text):
+            _record_fetch(url, "http")
+            if http_cache:
+                http_cache.put(url, response.text, response.headers, mode="http")
+            return response.text, False
+    except requests.RequestException as e:
+        if cached:
+            logger.warning(f"Revalidation failed for {url}, serving stale copy: {e}")
+            _record_fetch(url, "cache")
+            return cached["html"], False
+        logger.debug(f"HTTP fetch failed for {url}: {e}")
+    _record_fetch(url, "http_fallback")
+    return "", True
+
+def _store_rendered(url: str, html: str, headers: Dict):
+    _record_fetch(url, "browser" if html else "failed")
+    if html and http_cache:
+        http_cache.put(url, html, headers, mode="browser")
+
+def fetch_html(url: str) -> str:
+    domain = urlparse(url).netloc
+    with profiler.span("fetch", group=domain, url=url):
+        html, needs_render = fetch_html_http(url)
+    if not needs_render:
+        return html
+    with profiler.span("render", group=domain, url=url):
+        html, headers = render_html(url)
+    _store_rendered(url, html, headers)
+    return html
+
+async def fetch_html_async(pages: AsyncPagePool, url: str) -> str:
+    domain = urlparse(url).netloc
+    with profiler.span("fetch", group=domain, url=url):
+        html, needs_render = await asyncio.to_thread(fetch_html_http, url)
+    if not needs_render:
+        return html
+    with profiler.span("render", group=domain, url=url):
+        html, headers = await render_html_async(pages, url)
+    _store_rendered(url, html, headers)
+    return html
+
+def log_fetch_stats():
+    with fetch_stats_lock:
+        for domain, stats in sorted(fetch_stats.items()):
+            logger.info(
+                f"Fetch modes for {domain}: cache={stats['cache']} revalidated={stats['revalidated']} "
+                f"http={stats['http']} browser={stats['browser']} failed={stats['failed']} "
+                f"http_errors={stats['http_error']} "
+                f"(http fallbacks={stats['http_fallback']}, offline misses={stats['offline_miss']})"
+                + (" [needs browser]" if domain in needs_browser_domains else "")
+            )
 
 def load_previously_scraped_documents(filepaths: List[str]) -> tuple:
     loaded_urls = set()
@@ -171,6 +448,8 @@ USELESS_BODY_KEYWORDS = [
 ]
 
 
+_USELESS_BODY_RE = re.compile("|".join(re.escape(kw) for kw in USELESS_BODY_KEYWORDS), re.IGNORECASE)
+
 def is_useful_content(doc: Dict) -> bool:
     if not doc or not doc.get("text"):
         return False
@@ -178,142 +457,475 @@ def is_useful_content(doc: Dict) -> bool:
     text = doc["text"]
     title = (doc.get("title") or "").lower()
 
-    
     if any(kw in title for kw in USELESS_TITLE_KEYWORDS):
-        
-        return False
-
-    text_lower = text.lower()
-    if any(kw in text_lower for kw in USELESS_BODY_KEYWORDS):
-        
         return False
     if len(text) < MIN_TEXT_LENGTH:
-        
+        return False
+    if _USELESS_BODY_RE.search(text):
         return False
 
-    words = text.split()
-    if len(words) < MIN_WORD_COUNT:
-        
+    # Word count and boilerplate ratio in a single pass over the lines.
+    words = 0
+    lines = 0
+    boilerplate_lines = 0
+    for line in text.splitlines():
+        n = len(line.split())
+        if n == 0:
+            continue
+        words += n
+        lines += 1
+        if n <= 3:
+            boilerplate_lines += 1
+    if words < MIN_WORD_COUNT:
+        return False
+    if lines and boilerplate_lines / lines > MAX_BOILERPLATE_RATIO:
         return False
-    lines = [l for l in text.splitlines() if l.strip()]
-    if lines:
-        boilerplate_lines = sum(1 for l in lines if len(l.split()) <= 3)
-        ratio = boilerplate_lines / len(lines)
-        if ratio > MAX_BOILERPLATE_RATIO:
-            return False
 
     return True
 
+SKIP_PATTERNS = [
+    "#", "login", "signup", "cart", "search", 
+    ".pdf", ".jpg", ".png", ".gif", ".zip",
+]
+
+def is_crawlable(url: str, base_domain: str = None) -> bool:
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return False
+    if base_domain is not None and parsed.netloc != base_domain:
+        return False
+    return not any(pat in url.lower() for pat in SKIP_PATTERNS)
+
+def extract_links(soup: BeautifulSoup, base_url: str, same_domain: bool = True) -> List[str]:
+    links = set()
+    base_domain = urlparse(base_url).netloc if same_domain else None
+
+    for a_tag in soup.find_all("a", href=True):
+        href = a_tag["href"]
+        full_url = urljoin(base_url, href)
+        if is_crawlable(full_url, base_domain):
+            links.add(full_url)
+    return list(links)
+
+def extract_text(soup: BeautifulSoup) -> tuple:
+    for tag in soup(["script", "style", "nav", "footer", "header", "aside"]):
+        tag.decompose()
+
+    title = soup.title.string.strip() if soup.title and soup.title.string else ""
+    main_content = soup.find("main") or soup.find("article") or soup.find("body")
+    if main_content is None:
+        main_content = soup
+
+    text = main_content.get_text(separator="\n", strip=True)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return title, "\n".join(lines)
+
+def extract_page(html: str, url: str, follow_links: bool) -> tuple:
+    # Parses the page once for both its links and its document. Runs in the
+    # parse process pool, so it returns a status for the parent to log
+    # instead of logging itself, plus the parse and filter times for the
+    # profiler: (doc or None, links, status, label, (parse_s, filter_s)).
+    start = time.perf_counter()
+    try:
+        soup = BeautifulSoup(html, "lxml")
+        # Links are read before extract_text strips nav/header/footer.
+        links = extract_links(soup, url) if follow_links else []
+        title, text = extract_text(soup)
+    except Exception as e:
+        return None, [], "error", str(e), (time.perf_counter() - start, 0.0)
+    parsed = time.perf_counter()
+
+    doc = {"id": title, "url": url, "text": text}
+    useful = is_useful_content(doc)
+    timings = (parsed - start, time.perf_counter() - parsed)
+    if not useful:
+        return None, links, "filtered", title or url, timings
+    return doc, links, "ok", title or url, timings
+
+def _profile_extraction(url: str, timings: tuple):
+    # The times were measured in a worker process; the spans are placed so
+    # they end now, which ignores only the result's trip back.
+    parse_s, filter_s = timings
+    now = time.perf_counter()
+    domain = urlparse(url).netloc
+    profiler.record("parse", now - parse_s - filter_s, parse_s, group=domain, url=url)
+    profiler.record("filter", now - filter_s, filter_s, group=domain, url=url)
+
+def _log_extraction(url: str, status: str, label: str):
+    if status == "ok":
+        logger.info(f"Successfully scraped: {label}")
+    elif status == "filtered":
+        logger.info(f"Filtered out (not useful): {label}")
+    else:
+        logger.warning(f"Error parsing {url}: {label}")
+
+SITEMAP_STATE_FILE = "output/sitemap_state.json"
+MAX_SITEMAP_URLS = 500
+
+def load_sitemap_state(path: str) -> Dict[str, Dict]:
+    # Per domain: "since", the start of the last complete sitemap pass; and
+    # while a pass is still incomplete (cut by max_sitemap_urls, or with
+    # failed fetches), its "started" time and the URLs already "fetched" in
+    # it. Times are ISO strings.
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Older state files held only the timestamp.
+    return {domain: {"since": entry} if isinstance(entry, str) else entry for domain, entry in raw.items()}
+
+def save_sitemap_state(path: str, state: Dict[str, Dict]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(state.items())), f, indent=2)
+    os.replace(tmp_path, path)
+
 class WebScraper:
-    def __init__(self, urls, max_depth=2, max_workers=4):
+    def __init__(self, urls, max_depth=2, max_workers=4, store: DocumentStore = None, seen_stores: List[DocumentStore] = (),
+                 deduper: NearDuplicateIndex = None, parse_workers: int = None, discovery: str = "links",
+                 sitemap_state: str = SITEMAP_STATE_FILE, max_sitemap_urls: int = MAX_SITEMAP_URLS,
+                 request_delay: float = 0.5):
         self.urls = urls
         self.max_depth = max_depth
         self.max_workers = max_workers 
+        # Politeness sleep before each fetch in the threaded crawl.
+        self.request_delay = request_delay
+        # With a store, documents are appended to it as they finish instead
+        # of accumulating in self.documents; URLs already in the store or in
+        # seen_stores (earlier runs) are not fetched again.
+        self.store = store
+        self.seen_stores = list(seen_stores)
+        # Optional near-duplicate filter applied to every useful document
+        # before it is kept.
+        self.deduper = deduper
+        # 0 parses inline in the fetching thread.
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self._parse_pool = None
+        # "sitemap" takes subpages from each domain's robots.txt/sitemaps
+        # (fetched over plain HTTP) instead of rendering pages for links;
+        # domains without a sitemap fall back to link exploration.
+        self.discovery = discovery
+        self.sitemap_state = sitemap_state
+        self.max_sitemap_urls = max_sitemap_urls
+        self._sitemap_passes = {}
+        self._fetched = set()
         self.documents = []
 
     def get_subpage_links(self, html: str, base_url: str, same_domain: bool = True) -> List[str]:
         if not html:
             return []
-            
-        soup = BeautifulSoup(html, "lxml")
-        links = []
-        base_domain = urlparse(base_url).netloc
-
-        for a_tag in soup.find_all("a", href=True):
-            href = a_tag["href"]
-            full_url = urljoin(base_url, href)
-
-            parsed = urlparse(full_url)
-            if parsed.scheme not in ("http", "https"):
-                continue
-            if same_domain and parsed.netloc != base_domain:
-                continue
-
-            skip_patterns = [
-                "#", "login", "signup", "cart", "search", 
-                ".pdf", ".jpg", ".png", ".gif", ".zip",
-            ]
-            if any(pat in full_url.lower() for pat in skip_patterns):
-                continue
-
-            links.append(full_url)
-        return list(set(links))
-
-    def _fetch_and_get_links(self, url: str) -> List[str]:
-        time.sleep(0.5) 
+        return extract_links(BeautifulSoup(html, "lxml"), base_url, same_domain)
+
+    def _start_parse_pool(self):
+        # HTML parsing is CPU-bound, so it runs in worker processes instead
+        # of the I/O threads/event loop that drive fetching. scrape() creates
+        # the pool once, before those threads start; workers come from a
+        # fork server, so they never inherit Playwright or thread state from
+        # this process.
+        if self._parse_pool is None and self.parse_workers > 0:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+            self._parse_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.parse_workers,
+                                                                      mp_context=context)
+
+    def _shutdown_parse_pool(self):
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
+
+    def _parse(self, html: str, url: str, follow_links: bool) -> tuple:
+        pool = self._parse_pool
+        if pool is None:
+            doc, links, status, label, timings = extract_page(html, url, follow_links)
+        else:
+            doc, links, status, label, timings = pool.submit(extract_page, html, url, follow_links).result()
+        _profile_extraction(url, timings)
+        _log_extraction(url, status, label)
+        return doc, links
+
+    def _crawl_url(self, url: str, follow_links: bool) -> tuple:
+        # One render per page: the same HTML yields the document and, for
+        # pages above max_depth, the links for the next level.
+        time.sleep(self.request_delay)
         html = fetch_html(url)
-        return self.get_subpage_links(html, url)
-
-    def explore(self, urls, depth=0):
-        if depth >= self.max_depth:
-            return []
-            
-        urls_to_visit = []
+        if not html:
+            return None, []
+        self._fetched.add(url)
+        return self._parse(html, url, follow_links)
+
+    def _already_stored(self, url: str) -> bool:
+        if self.store is not None and url in self.store:
+            return True
+        return any(url in seen for seen in self.seen_stores)
+
+    def _emit(self, doc: Dict):
+        if self.deduper is not None and self.deduper.is_duplicate(doc):
+            return
+        if self.store is not None:
+            self.store.append(doc)
+        else:
+            self.documents.append(doc)
+
+    def _claim_unvisited(self, urls) -> List[str]:
+        claimed = []
         with visited_lock:
             for url in urls:
-                if url not in visited_urls:
+                if url not in visited_urls and not self._already_stored(url):
                     visited_urls.add(url)
-                    urls_to_visit.append(url)
-                    
-        if not urls_to_visit:
-            return []
-
-        all_links = []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_url = {executor.submit(self._fetch_and_get_links, url): url for url in urls_to_visit}
-            for future in concurrent.futures.as_completed(future_to_url):
-                discovered_links = future.result()
-                if discovered_links:
-                    all_links.extend(discovered_links)
-
-        all_links.extend(self.explore(list(set(all_links)), depth + 1))
-        return list(set(all_links))
-
-    def _scrape_url(self, url: str) -> Dict:
-        time.sleep(0.5)
-        html = fetch_html(url)
-        if not html:
+                    claimed.append(url)
+        return claimed
+
+    def _sitemap_urls(self, base_url: str, domain_state: Dict) -> tuple:
+        # Same-domain, non-skipped sitemap URLs changed since the last
+        # complete pass and not yet fetched in the current one, newest first
+        # and capped at max_sitemap_urls: (urls, truncated). None when the
+        # domain has no sitemap, or none of its URLs are on the seed's host
+        # or the host the seed redirects to (apex vs www.).
+        session = get_http_session()
+        entries = discover_from_sitemaps(session, base_url)
+        if entries is None:
             return None
-            
+        domain = urlparse(base_url).netloc
+        hosts = {domain}
         try:
-            soup = BeautifulSoup(html, 'lxml')
-            
-            for tag in soup(["script", "style", "nav", "footer", "header", "aside"]):
-                tag.decompose()
-
-            title = soup.title.string.strip() if soup.title and soup.title.string else ""
-            main_content = soup.find("main") or soup.find("article") or soup.find("body")
-            if main_content is None:
-                main_content = soup
-
-            text = main_content.get_text(separator="\n", strip=True)
-            lines = [line.strip() for line in text.splitlines() if line.strip()]
-            text = "\n".join(lines)
-            
-            doc = {"id": title, "url": url, "text": text}
-            if not is_useful_content(doc):
-                logger.info(f"Filtered out (not useful): {title or url}")
-                return None
-            logger.info(f"Successfully scraped: {title or url}")
-            return doc
-            
-        except Exception as e:
-            logger.warning(f"Error parsing {url}: {e}")
+            with session.get(base_url, timeout=15, stream=True) as response:
+                hosts.add(urlparse(response.url).netloc)
+        except requests.RequestException as e:
+            logger.debug(f"Could not resolve {base_url}: {e}")
+        entries = [(url, lastmod) for url, lastmod in entries
+                   if urlparse(url).netloc in hosts and is_crawlable(url)]
+        if not entries:
+            logger.info(f"Sitemap for {domain} lists no crawlable URLs on {', '.join(sorted(hosts))}")
             return None
+        since = domain_state.get("since")
+        since = datetime.fromisoformat(since) if since else None
+        fetched = set(domain_state.get("fetched", ()))
+        changed = [
+            (url, lastmod) for url, lastmod in entries
+            if url not in fetched and (since is None or lastmod is None or lastmod > since)
+        ]
+        changed.sort(key=lambda e: e[1] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+        truncated = len(changed) > self.max_sitemap_urls
+        logger.info(f"Sitemap discovery for {domain}: {len(changed)} changed URLs, "
+                    f"{len(entries) - len(changed)} unchanged or already fetched"
+                    + (f", keeping newest {self.max_sitemap_urls} for this run" if truncated else ""))
+        return [url for url, _ in changed[:self.max_sitemap_urls]], truncated
+
+    def _seed_frontier(self) -> List[tuple]:
+        # (url, depth) pairs to start from. Sitemap URLs and seeds of domains
+        # with a sitemap enter at max_depth, so their links are not followed.
+        seeds = self._claim_unvisited(self.urls.values())
+        if self.discovery != "sitemap":
+            return [(url, 0) for url in seeds]
+        if http_cache is not None and http_cache.offline:
+            logger.info("Offline: sitemap discovery skipped, exploring links instead")
+            return [(url, 0) for url in seeds]
+
+        base_urls = {}
+        for url in self.urls.values():
+            base_urls.setdefault(urlparse(url).netloc, url)
+        state = load_sitemap_state(self.sitemap_state)
+        started = datetime.now(timezone.utc)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            discovered = dict(zip(base_urls, executor.map(
+                lambda domain: self._sitemap_urls(base_urls[domain], state.get(domain, {})), base_urls
+            )))
+
+        frontier = [
+            (url, self.max_depth if discovered[urlparse(url).netloc] is not None else 0) for url in seeds
+        ]
+        self._sitemap_passes = {}
+        for domain, found in discovered.items():
+            if found is None:
+                continue
+            urls, truncated = found
+            queued = self._claim_unvisited(urls)
+            frontier.extend((url, self.max_depth) for url in queued)
+            self._sitemap_passes[domain] = {
+                "started": state.get(domain, {}).get("started") or started.isoformat(),
+                "queued": queued,
+                # Already stored or claimed elsewhere in this run: done.
+                "skipped": [url for url in urls if url not in set(queued)],
+                "truncated": truncated,
+            }
+        explored = sorted(domain for domain, urls in discovered.items() if urls is None)
+        if explored:
+            logger.info(f"No sitemap, exploring links: {', '.join(explored)}")
+        return frontier
+
+    def _save_sitemap_state(self):
+        # A domain's "since" only advances once a pass has fetched every
+        # changed URL: until then URLs cut by the cap or whose fetch failed
+        # would be older than "since" and skipped for good.
+        if not self._sitemap_passes:
+            return
+        state = load_sitemap_state(self.sitemap_state)
+        for domain, run in self._sitemap_passes.items():
+            entry = state.get(domain, {})
+            fetched = set(entry.get("fetched", ())) | set(run["skipped"])
+            fetched |= {url for url in run["queued"] if url in self._fetched}
+            failed = sum(1 for url in run["queued"] if url not in self._fetched)
+            if run["truncated"] or failed:
+                state[domain] = {"since": entry.get("since"), "started": run["started"], "fetched": sorted(fetched)}
+                logger.info(f"Sitemap pass for {domain} incomplete ({failed} failed fetches"
+                            + (", more URLs than max_sitemap_urls" if run["truncated"] else "")
+                            + f"); {len(fetched)} URLs done so far")
+            else:
+                state[domain] = {"since": run["started"]}
+        save_sitemap_state(self.sitemap_state, state)
 
     def scrape(self):
+        self._start_parse_pool()
+        try:
+            frontier = self._seed_frontier()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while frontier:
+                    next_depth = {}
+                    future_to_depth = {
+                        executor.submit(self._crawl_url, url, depth < self.max_depth): depth for url, depth in frontier
+                    }
+                    for future in concurrent.futures.as_completed(future_to_depth):
+                        doc, links = future.result()
+                        if doc:
+                            self._emit(doc)
+                        for link in links:
+                            next_depth.setdefault(link, future_to_depth[future] + 1)
+
+                    frontier = [(url, next_depth[url]) for url in self._claim_unvisited(next_depth)]
+        finally:
+            self._shutdown_parse_pool()
+        self._save_sitemap_state()
+        log_fetch_stats()
+
+
+class HostFrontier:
+    # Priority frontier split by host. pop_ready returns the best-priority
+    # URL whose host is under its concurrency cap and past its politeness
+    # delay, so a slow host never blocks work queued for the others.
+    def __init__(self, per_host_concurrency: int, host_delay: float):
+        self.per_host_concurrency = per_host_concurrency
+        self.host_delay = host_delay
+        self.queues = defaultdict(list)
+        self.active = defaultdict(int)
+        self.next_allowed = defaultdict(float)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def push(self, url: str, depth: int):
+        heapq.heappush(self.queues[urlparse(url).netloc], (depth, next(self._seq), url))
+
+    def pop_ready(self, now: float):
+        best_host = None
+        for host, queue in self.queues.items():
+            if not queue or self.active[host] >= self.per_host_concurrency or self.next_allowed[host] > now:
+                continue
+            if best_host is None or queue[0] < self.queues[best_host][0]:
+                best_host = host
+        if best_host is None:
+            return None
+        depth, _, url = heapq.heappop(self.queues[best_host])
+        self.active[best_host] += 1
+        self.next_allowed[best_host] = now + self.host_delay
+        return url, depth
+
+    def release(self, url: str):
+        self.active[urlparse(url).netloc] -= 1
+
+    def seconds_until_ready(self, now: float):
+        # Time until a delayed host can be dispatched again, or None if every
+        # queued host is waiting on its concurrency cap instead.
+        waits = [
+            self.next_allowed[host] - now for host, queue in self.queues.items()
+            if queue and self.active[host] < self.per_host_concurrency
+        ]
+        return max(0.0, min(waits)) if waits else None
+
+
+class AsyncWebScraper(WebScraper):
+    # Same crawl and output as WebScraper, driven by one asyncio loop over a
+    # single (lazily launched) Chromium instance: fetches reuse pages from one shared context,
+    # total and per-host concurrency are capped, and the politeness delay is
+    # tracked per host rather than slept in every worker.
+    def __init__(self, urls, max_depth=2, max_concurrency=8, per_host_concurrency=2, host_delay=0.5,
+                 store: DocumentStore = None, seen_stores: List[DocumentStore] = (), deduper: NearDuplicateIndex = None,
+                 parse_workers: int = None, discovery: str = "links", sitemap_state: str = SITEMAP_STATE_FILE,
+                 max_sitemap_urls: int = MAX_SITEMAP_URLS):
+        super().__init__(urls, max_depth=max_depth, max_workers=max_concurrency, store=store, seen_stores=seen_stores,
+                         deduper=deduper, parse_workers=parse_workers, discovery=discovery,
+                         sitemap_state=sitemap_state, max_sitemap_urls=max_sitemap_urls)
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.host_delay = host_delay
+
+    async def _crawl_page(self, pages: AsyncPagePool, url: str, depth: int) -> tuple:
+        html = await fetch_html_async(pages, url)
+        if not html:
+            return url, depth, None, []
+        self._fetched.add(url)
+        follow_links = depth < self.max_depth
+        pool = self._parse_pool
+        if pool is None:
+            result = await asyncio.to_thread(extract_page, html, url, follow_links)
+        else:
+            result = await asyncio.get_running_loop().run_in_executor(pool, extract_page, html, url, follow_links)
+        doc, links, status, label, timings = result
+        _profile_extraction(url, timings)
+        _log_extraction(url, status, label)
+        return url, depth, doc, links
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        frontier = HostFrontier(self.per_host_concurrency, self.host_delay)
+        for url, depth in await asyncio.to_thread(self._seed_frontier):
+            frontier.push(url, depth)
+
+        async with async_playwright() as playwright:
+            pages = AsyncPagePool(playwright)
+            pending = set()
+            try:
+                while pending or len(frontier):
+                    while len(pending) < self.max_concurrency:
+                        entry = frontier.pop_ready(loop.time())
+                        if entry is None:
+                            break
+                        url, depth = entry
+                        pending.add(asyncio.create_task(self._crawl_page(pages, url, depth)))
+
+                    # With every slot busy only a finished task can free one,
+                    # so wait for it rather than for a host's delay to pass.
+                    timeout = None
+                    if len(pending) < self.max_concurrency:
+                        timeout = frontier.seconds_until_ready(loop.time())
+                    if not pending:
+                        await asyncio.sleep(timeout or 0)
+                        continue
+                    done, pending = await asyncio.wait(
+                        pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        url, depth, doc, links = task.result()
+                        frontier.release(url)
+                        if doc:
+                            self._emit(doc)
+                        for link in self._claim_unvisited(links):
+                            frontier.push(link, depth + 1)
+            finally:
+                for task in pending:
+                    task.cancel()
+                await pages.close()
 
-        discovered_urls = self.explore(list(self.urls.values()))
-        
-        urls_to_scrape = list(set(self.urls.values()).union(set(discovered_urls)))
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_url = {executor.submit(self._scrape_url, url): url for url in urls_to_scrape}
-            for future in concurrent.futures.as_completed(future_to_url):
-                doc = future.result()
-                if doc:
-                    self.documents.append(doc)
+    def scrape(self):
+        self._start_parse_pool()
+        try:
+            asyncio.run(self._crawl())
+        finally:
+            self._shutdown_parse_pool()
+        self._save_sitemap_state()
+        log_fetch_stats()
 
 def save_documents(documents: List[Dict], output_path: str):
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -322,26 +934,83 @@ def save_documents(documents: List[Dict], output_path: str):
     logger.info(f"Saved {len(documents)} documents to {output_path}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--http-cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-http-cache", action="store_true")
+    parser.add_argument("--offline", action="store_true",
+                        help="serve pages only from the HTTP cache, never touching the network")
+    parser.add_argument("--no-block-resources", action="store_true",
+                        help="let rendered pages load images, fonts, media, stylesheets and trackers")
+    parser.add_argument("--no-page-reuse", action="store_true",
+                        help="open a fresh browser page for every render")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8,
+                        help="estimated Jaccard similarity above which a document is dropped as a near-duplicate")
+    parser.add_argument("--discovery", choices=["links", "sitemap"], default="links",
+                        help="find subpages from robots.txt/sitemaps, exploring links only where no sitemap exists")
+    parser.add_argument("--max-sitemap-urls", type=int, default=MAX_SITEMAP_URLS,
+                        help="per-domain cap on sitemap URLs, newest lastmod first")
+    parser.add_argument("--profile", action="store_true",
+                        help="time fetch/render/parse/filter per URL and domain; summary in output/scrape_profile.json")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="also write a Chrome-trace JSON timeline of every URL's stages to PATH")
+    args = parser.parse_args()
+    if args.profile or args.trace:
+        profiler.enable()
+    block_resources = not args.no_block_resources
+    reuse_pages = not args.no_page_reuse
+    if not args.no_http_cache:
+        http_cache = HTTPCache(args.http_cache_dir, offline=args.offline)
 
     previous_files = [
         "output/scraped_documents_3.json"
     ]
-    previous_urls, previous_docs = load_previously_scraped_documents(previous_files)
-
-    with visited_lock:
-        visited_urls.update(previous_urls)
-
-    scraper = WebScraper(SCRAPE_URLS_7, max_depth=1, max_workers=4)
+    # Earlier JSON outputs are converted once; afterwards only their URL
+    # indexes are loaded.
+    previous_stores = []
+    for json_path in previous_files:
+        jsonl_path = os.path.splitext(json_path)[0] + ".jsonl"
+        if not os.path.exists(jsonl_path):
+            if not os.path.exists(json_path):
+                logger.warning(f"File {json_path} not found. Skipping.")
+                continue
+            convert_json_to_jsonl([json_path], jsonl_path).close()
+        previous_stores.append(DocumentStore(jsonl_path))
+
+    # Fingerprints persist across runs; a fresh index is seeded with the
+    # documents earlier runs kept.
+    deduper = NearDuplicateIndex(threshold=args.dedup_threshold, path="output/near_duplicate_index.npz")
+    if len(deduper) == 0:
+        for previous in previous_stores:
+            for doc in previous:
+                deduper.check(doc)
+
+    # Rerunning after a crash resumes into the same store and skips URLs
+    # it already holds.
+    store = DocumentStore("output/scraped_documents_10.jsonl")
+    scraper = AsyncWebScraper(SCRAPE_URLS_7, max_depth=1, max_concurrency=8, per_host_concurrency=2,
+                              store=store, seen_stores=previous_stores, deduper=deduper,
+                              discovery=args.discovery, max_sitemap_urls=args.max_sitemap_urls)
     scraper.scrape()
+    deduper.save()
+    deduper.write_report("output/near_duplicates_10.json")
 
-    target_urls = set(scraper.urls.values())
     reused = 0
-    for doc in previous_docs:
-        if doc["url"] in target_urls and is_useful_content(doc):
-            scraper.documents.append(doc)
-            reused += 1
-
-    save_documents(scraper.documents, "output/scraped_documents_9.json")
+    for url in set(scraper.urls.values()):
+        for previous in previous_stores:
+            doc = previous.get(url)
+            if doc and is_useful_content(doc):
+                reused += store.append(doc)
+                break
+    logger.info(f"Reused {reused} seed documents from previous runs; {len(store)} documents in {store.path}")
+    if profiler.enabled:
+        logger.info("Crawl profile:\n" + profiler.format_summary(grouped=True))
+        profiler.write_summary("output/scrape_profile.json")
+        if args.trace:
+            profiler.write_trace(args.trace)
+
+    store.close()
+    for previous in previous_stores:
+        previous.close()
 
     # scraper = WebScraper(SCRAPE_URLS_4, max_depth=2, max_workers=4)
     # scraper.scrape()